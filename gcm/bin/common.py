@@ -9,6 +9,8 @@ __author__ = "Eric Sandbling"
 __status__ = 'Development'
 
 import os, sys
+import time
+import ctypes, ctypes.util
 from os import listdir
 from os.path import isfile, join
 
@@ -60,6 +62,132 @@ def getLocalConfig():
 
     return config
 
+def getConfigOption(config, section, option, default=None):
+    '''
+    Get optional configuration parameter, or default if not defined.
+    '''
+    if config.has_option(section, option):
+        return config.get(section, option)
+    return default
+
+#### Timing Methods ####
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+_CLOCK_MONOTONIC = 1
+
+try:
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or 'libc.so.6').clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+def monotonic():
+    '''
+    Seconds of monotonic clock (not affected by system clock changes), or
+    wall-clock time if not available.
+    '''
+    if _clock_gettime is None:
+        return time.time()
+    ts = _timespec()
+    if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+class cycleScheduler(object):
+    '''
+    Fixed-rate scheduler on the monotonic clock.
+
+    Ticks are at start + n * period, so wake-up delays do not accumulate
+    (drift). Ticks missed by an overrunning cycle are skipped rather than run
+    back-to-back. Period 0 runs cycles without pacing.
+    '''
+
+    def __init__(self, period=1.0):
+        '''
+        Initialize class
+        '''
+        self.period = period
+        self._start = None          # Monotonic time of tick 0
+        self._tick = 0
+        self._cycleStart = None
+
+        # Output variable
+        self.metrics = {
+            'cyclePeriod': period,
+            'cycles': 0,
+            'cycleTime': 0,
+            'cycleTimeMax': 0,
+            'overruns': 0,
+            'ticksSkipped': 0,
+            'jitter': 0,
+            'jitterMax': 0
+            }
+
+    def setPeriod(self, period):
+        '''
+        Set period (s). Ticks are re-aligned to the next cycle start.
+        '''
+        if period != self.period:
+            self.period = period
+            self.metrics['cyclePeriod'] = period
+            self.reset()
+
+    def reset(self):
+        '''
+        Re-align ticks to the next cycle start, e.g. after a pause.
+        '''
+        self._start = None
+        self._cycleStart = None
+
+    def wait(self, stopEvent):
+        '''
+        End current cycle and wait for the next tick. Returns False if
+        stopEvent is set.
+        '''
+        now = monotonic()
+
+        # Timing of ended cycle
+        if self._cycleStart is not None:
+            cycleTime = now - self._cycleStart
+            self.metrics['cycles'] += 1
+            self.metrics['cycleTime'] = round(cycleTime, 3)
+            self.metrics['cycleTimeMax'] = round(max(self.metrics['cycleTimeMax'], cycleTime), 3)
+
+        # First cycle or no pacing - start at once
+        if self._start is None or self.period <= 0:
+            self._start = self._cycleStart = now
+            self._tick = 0
+            return not stopEvent.is_set()
+
+        tick = self._tick + 1
+        due = self._start + tick * self.period
+
+        # Overrun - skip missed ticks
+        if now > due:
+            missed = int((now - due) // self.period) + 1
+            self.metrics['overruns'] += 1
+            self.metrics['ticksSkipped'] += missed
+            tick += missed
+            due = self._start + tick * self.period
+
+        # Wait for tick (Event.wait is not monotonic, so re-check)
+        while True:
+            delay = due - monotonic()
+            if delay <= 0:
+                break
+            if stopEvent.wait(delay):
+                return False
+
+        now = monotonic()
+        jitter = now - due
+        self._tick = tick
+        self._cycleStart = now
+        self.metrics['jitter'] = round(jitter, 4)
+        self.metrics['jitterMax'] = round(max(self.metrics['jitterMax'], jitter), 4)
+        return not stopEvent.is_set()
+
 #### Logging Methods ####
 
 _logLevelStr = {
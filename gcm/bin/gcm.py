@@ -24,7 +24,10 @@ import ConfigParser
 from owd import owDevices
 from gdb import GregerDatabase
 from gua import GregerUpdateAgent
+from gpa import GregerPublishAgent
 from common import getLocalConfig
+from common import cycleScheduler
+from tsd import columnarChunks
 
 class GregerClientModule(Thread):
     """
@@ -65,6 +68,12 @@ class GregerClientModule(Thread):
         localLog.debug("Attempting to start Greger Update Agent (GUA)...")
         self.GregerUpdateAgent.start()
 
+        # Initialize Greger Publish Agent
+        localLog.debug("Attempting to initiate Greger Publish Agent (GPA)...")
+        self.GregerPublishAgent = GregerPublishAgent(self.GregerDatabase)
+        localLog.debug("Attempting to start Greger Publish Agent (GPA)...")
+        self.GregerPublishAgent.start()
+
         # Init owDevices and update settings
         localLog.debug("Attempting to initiate 1-Wire Server connection...")
         self.owDevices = owDevices()
@@ -118,6 +127,10 @@ class GregerClientModule(Thread):
 
         # Execution Timer parameters
         self.stopExecution = Event()
+        self.scheduler = cycleScheduler()
+
+        # Timeseries high-water marks (last key published, per series path)
+        self._highWaterMarks = {}
         self.stopTime = 0
         self.pauseExecution = False
 
@@ -156,6 +169,15 @@ class GregerClientModule(Thread):
         else:
             localLog.debug("Skipping to stop Greger Update Agent (GUA).")
 
+        # Stop Greger Publish Agent (GPA), publishing queued updates
+        localLog.debug("Attempting to stop Greger Publish Agent (GPA)...")
+        try:
+            self.GregerPublishAgent.stop()
+            self.GregerPublishAgent.join()
+            self.log.info("Greger Publish Agent (GPA) stopped!")
+        except Exception as e:
+            localLog.error("Oops! Failed to stop Greger Publish Agent (GPA) - " + str(e))
+
         # Stop Greger Database (GDB)
         localLog.debug("Attempting to stop Greger Database (GDB)...")
         try:
@@ -183,6 +205,53 @@ class GregerClientModule(Thread):
         self.log.info("All threads are stopped!")
         self.log.info("Execution stopped at: " + time.strftime('%Y-%m-%d %H:%M:%S'))
 
+    def _timeseriesUpdates(self, root, timeseries, marks):
+        '''
+        Updates (path, points) of each device/sensor series, with the points
+        newer than the series high-water mark. The new high-water mark of
+        each series is added to marks.
+
+        With columnar encoding (setting gcmTimeseriesEncoding), the points are
+        published as columnar documents of gcmTimeseriesChunkSize points,
+        keyed by their first epoch. Points of a partial chunk are held until
+        the chunk is full, or older than gcmTimeseriesChunkAge.
+        '''
+        settings = self.GregerDatabase.options
+        columnar = settings.gcmTimeseriesEncoding == 'columnar'
+        t = time.time()
+
+        updates = []
+        for device in timeseries:
+            for sensor in timeseries[device]:
+                updatePath = root + device + "/" + sensor
+                mark = self._highWaterMarks.get(updatePath, 0)
+                series = timeseries[device][sensor]
+                newKeys = sorted(int(key) for key in series if int(key) > mark)
+                if not newKeys:
+                    continue
+                if columnar:
+                    chunks = columnarChunks([(key, series[str(key)]) for key in newKeys],
+                        settings.gcmTimeseriesChunkSize, settings.gcmTimeseriesChunkAge, t)
+                    if chunks:
+                        updates.append((updatePath, dict((str(document['t0']), document)
+                            for last, document in chunks)))
+                        marks[updatePath] = chunks[-1][0]
+                else:
+                    updates.append((updatePath, dict((str(key), series[str(key)]) for key in newKeys)))
+                    marks[updatePath] = newKeys[-1]
+        return updates
+
+    def _confirmTimeseries(self, marks, confirmed):
+        '''
+        Advance high-water marks of series updates confirmed by the server.
+        Unconfirmed points are published again next cycle.
+        '''
+        localLog = logging.getLogger(self.logPath + "._confirmTimeseries")
+        for updatePath, mark in marks.items():
+            if updatePath in confirmed:
+                self._highWaterMarks[updatePath] = max(mark, self._highWaterMarks.get(updatePath, 0))
+                localLog.debug(updatePath + " updated up to " + str(mark) + ".")
+
     def run(self):
         '''
         Main loop of the program.
@@ -205,38 +274,57 @@ class GregerClientModule(Thread):
         # Main loop
         while not self.stopExecution.is_set():
             # Check if execution is paused
-            if not self.GregerDatabase.settings['gcmEnableOWD']['value']:
-                localLog.debug(self.GregerDatabase.settings['gcmEnableOWD']['name'] + " = False (pausing 1s...)")
+            if not self.GregerDatabase.options.gcmEnableOWD:
+                localLog.debug("gcmEnableOWD = False (pausing 1s...)")
+                self.scheduler.reset()
                 time.sleep(1)
                 continue
 
+            # Wait for next cycle
+            self.scheduler.setPeriod(self.GregerDatabase.options.gcmCyclePeriod)
+            if not self.scheduler.wait(self.stopExecution):
+                break
+
             # Read ow devices
             localLog.debug("Attempting to read 1-Wire Devices...")
             owDeviceReading = self.owDevices.readAll()
             localLog.debug("Retrieving timeseries...")
             timeseries = self.owDevices.timeseries
 
-            # Publish current to firebase
-            localLog.debug("Attempting to publish current 1-Wire Device reading to database...")
+            # Collect timeseries updates
+            localLog.debug("Collecting timeseries updates...")
+            seriesMarks = {}
+            # Update each device time-series
+            seriesUpdates = self._timeseriesUpdates('timeseries/', timeseries, seriesMarks)
+            # Update each rollup tier device time-series
+            rollups = self.owDevices.rollups
+            for tier in rollups:
+                seriesUpdates += self._timeseriesUpdates('timeseries/' + tier + "/", rollups[tier],
+                    seriesMarks)
+
+            # Collect metrics updates
+            metricsUpdates = [
+                ('metrics/owd', self.owDevices.metrics),
+                ('metrics/gcm', self.scheduler.metrics),
+                ('metrics/gpa', self.GregerPublishAgent.metrics)]
+            if self.GregerDatabase.queue is not None:
+                metricsUpdates.append(('metrics/gdq', self.GregerDatabase.queue.metrics))
+
+            # Publish current, timeseries and metrics to firebase (batched,
+            # in background)
+            localLog.debug("Attempting to queue 1-Wire Device reading, timeseries and metrics for publishing...")
             try:
-                self.GregerDatabase.update('current', owDeviceReading)
-                self.log.info("Current 1-Wire Device reading published to Firebse Realtime DataBase.")
+                self.GregerPublishAgent.publish(
+                    [('current', owDeviceReading)] + seriesUpdates + metricsUpdates,
+                    lambda confirmed, seriesMarks=seriesMarks:
+                        self._confirmTimeseries(seriesMarks, confirmed))
+                localLog.debug("Reading and " + str(len(seriesUpdates)) + " timeseries queued for publishing.")
             except Exception as e:
                 self.log.warning("Oops! Failed to update data! - " + str(e))
 
-            # Publish timeseries to firebsae
-            localLog.debug("Attempting to publish timeseries to database...")
-            # Update each device time-series
-            for device in timeseries:
-                for sensor in timeseries[device]:
-                    updatePath = 'timeseries/' + device + "/" + sensor
-                    try:
-                        self.GregerDatabase.update(updatePath, self.owDevices.timeseries[device][sensor])
-                        localLog.debug(updatePath + " updated with latest timeseries.")
-                    except Exception as e:
-                        self.log.warning("Oops! Failed to update data! - " + str(e))
-            # Print message
-            self.log.info("Timeseries published to Firebase Realtime Database.")
+        # Close 1-Wire server session
+        localLog.debug("Attempting to close 1-Wire server session...")
+        self.owDevices.close()
 
         # Print END message
         localLog.debug("Execution stoped!")
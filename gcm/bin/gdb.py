@@ -10,29 +10,31 @@ __author__ = "Eric Sandbling"
 __status__ = 'Development'
 
 # Modules goes here
-import ow
-import time, sys
+import os, time, sys
+import json
+import copy
 import logging
 from threading import Event
+from threading import Lock
 from threading import Thread
 from threading import enumerate
 
-# Firebase Python Admin SDK
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
-
 # Local Modules
 from common import getLocalConfig
+from common import getConfigOption
 from common import setLogLevel
+from gdq import GregerDatabaseQueue
+from gds import GregerSettings
+from gsb import createBackend
 
 class GregerDatabase(Thread):
     '''
-    Class representing all Greger (Firebase RealTime) DataBase (GDB) actions
+    Class representing all Greger DataBase (GDB) actions
     available to the Greger Client Module (GCM).
     '''
 
     settings = {}
+    options = GregerSettings()      # Typed settings, e.g. options.gcmCyclePeriod
     # about = {}
 
     def __init__(self):
@@ -44,20 +46,31 @@ class GregerDatabase(Thread):
         # Stop execution handler
         self.stopExecution = Event()
 
+        # Settings
+        self._settingsLock = Lock()
+        self._settingsStream = None
+        self._accountReviewedOK = False
+
         # Logging
         self.logPath = "root.GDB"
         self.log = logging.getLogger(self.logPath)
         localLog = logging.getLogger(self.logPath + ".__init__")
         localLog.debug("Initiating Greger Database (GDB)...")
 
-        # Initialize Firebase connection
+        # Load last known good settings (refreshed in background, see run())
+        self._loadSettings()
+
+        # Initialize storage backend connection
         self._initConnection()
+
+        # Initialize outbound queue
+        self._initQueue()
         self.log.info("Greger Database (GDB) successfully initiated!")
 
     def _initConnection(self):
         '''
-        Initiate Firebase Admin SDK connection and obtain Realtime Database
-        reference (root)
+        Initiate storage backend (greger_database/backend, Firebase Realtime
+        Database by default) and client account path.
         '''
         # Logging
         localLog = logging.getLogger(self.logPath + "._initConnection")
@@ -67,47 +80,103 @@ class GregerDatabase(Thread):
         config = getLocalConfig()
 
         # Locally relevant parameters
-        gdbCert = config.get("greger_database", "cert")
-        gdbURI = config.get("greger_database", "uri")
         gcmName = config.get("greger_client_module","name")
-        localLog.debug("Parameter: (gdbCert) " + gdbCert)
-        localLog.debug("Parameter: (gdbURI) " + gdbURI)
+        self.gcmPath = config.get("greger_database", "root") + "/" + gcmName
         localLog.debug("Parameter: (gcmName) " + gcmName)
+        localLog.debug("Parameter: (gcmPath) " + self.gcmPath)
 
-
-        # Initiate connection using Certificate
-        localLog.debug("Attempting to initiate connection to Firebase Realtime Database...")
+        # Initiate connection
+        localLog.debug("Attempting to initiate storage backend...")
+        self.backend = None
         try:
-            self.cred = credentials.Certificate(gdbCert)
-            localLog.debug("Credentials successfully entered from " + gdbCert)
+            self.backend = createBackend(config)
 
-            self.firebase_app = firebase_admin.initialize_app(self.cred, {'databaseURL': gdbURI})
-            localLog.debug("Handle to Realtime Database successfully obtained from " + gdbURI)
+            # successful message
+            self.log.info("Connection to Greger DataBase (" + self.backend.name + ") successfully established!")
 
-            self.dbRoot = db.reference()
-            localLog.debug("Reference to Firebse Realtime Database obtained.")
+        except Exception as e:
+            self.log.warning("Oops! Failed to initiate storage backend! - " + str(e))
 
-            # successful message
-            self.log.info("Connection to Greger DataBase (Firebase Admin Python SDK) successfully established!")
+        # Account and settings are reviewed in background (see run())
 
+        # localLog.debug("Attempting to retrieve about from account...")
+        # self._getAbout()
+
+    def _loadSettings(self):
+        '''
+        Load last known good settings from local disk
+        (greger_database/settingscache).
+        '''
+        localLog = logging.getLogger(self.logPath + "._loadSettings")
+
+        # Get Local Configuration Parameters
+        config = getLocalConfig()
+        self._settingsCachePath = getConfigOption(config, "greger_database", "settingscache",
+            "/var/lib/gcm/settings.json")
+        localLog.debug("Parameter: (settingsCachePath) " + self._settingsCachePath)
+
+        try:
+            with open(self._settingsCachePath, "r") as f:
+                settings = json.load(f)
+        except IOError:
+            localLog.debug("No local settings found.")
+            return
         except Exception as e:
-            self.log.warning("Oops! Failed to initiate Firebase connection! - " + str(e))
+            self.log.warning("Oops! Failed to load local settings! - " + str(e))
+            return
 
+        self._applySettings(settings, save=False)
+        self.log.info("Last known settings loaded from " + self._settingsCachePath + ".")
 
-        # Ensure client is defined
-        localLog.debug("Ensuring account for " + gcmName + " is correct and updated...")
-        self._setupAccount()
+    def _saveSettings(self, settings):
+        '''
+        Save settings to local disk (atomically replaced).
+        '''
+        localLog = logging.getLogger(self.logPath + "._saveSettings")
+
+        tmpPath = self._settingsCachePath + ".tmp"
+        try:
+            directory = os.path.dirname(self._settingsCachePath)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(tmpPath, "w") as f:
+                json.dump(settings, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmpPath, self._settingsCachePath)
+            localLog.debug("Settings saved to " + self._settingsCachePath + ".")
+        except Exception as e:
+            self.log.warning("Oops! Failed to save settings locally! - " + str(e))
 
-        # Retrieve Settings
-        localLog.debug("Attempting to retrieve settings from account...")
-        self._getSettings()
+    def _initQueue(self):
+        '''
+        Open durable outbound queue, if configured (greger_database/queue).
+        '''
+        localLog = logging.getLogger(self.logPath + "._initQueue")
 
-        # localLog.debug("Attempting to retrieve about from account...")
-        # self._getAbout()
+        # Get Local Configuration Parameters
+        config = getLocalConfig()
+        queuePath = getConfigOption(config, "greger_database", "queue")
+        queueMaxBytes = int(getConfigOption(config, "greger_database", "queuemaxbytes", 50000000))
+        queueCommitInterval = float(getConfigOption(config, "greger_database", "queuecommitinterval", 5))
+        localLog.debug("Parameter: (queuePath) " + str(queuePath))
+
+        self.queue = None
+        if not queuePath:
+            localLog.debug("Outbound queue disabled.")
+            return
+        try:
+            self.queue = GregerDatabaseQueue(queuePath, queueMaxBytes, queueCommitInterval)
+        except Exception as e:
+            self.log.error("Oops! Failed to open outbound queue! (updating directly) - " + str(e))
 
     def _setupAccount(self):
         '''
         Reset and/or setup Greger Client Module account with default values.
+
+        The client account and the default account are fetched once each, and
+        all keys missing in the client account are added in a single
+        multi-path update. Settings of the reviewed account are applied.
         '''
         localLog = logging.getLogger(self.logPath + "._setupAccount")
 
@@ -123,67 +192,55 @@ class GregerDatabase(Thread):
         localLog.debug("Parameter: (gcmPath) " + gcmPath)
         localLog.debug("Parameter: (defaultPath) " + defaultPath)
 
-        # Does client exist?
-        if self.dbRoot.child(gcmPath).get(shallow=True) is None:
-            localLog.debug("Client account is missing!")
-            localLog.debug("Attempting to create client account using GDB default account.")
-            try:
-                self.dbRoot.child(gcmPath).update(self.dbRoot.child(defaultPath).get())
-                self.log.info("Greger Client Module account successfully created from default!")
-            except Exception as e:
-                self.log.error("Oops! Failed to create Greger Client Module account on server! - " + str(e))
-
-        # Does settings exist?
-        localLog.debug("Checking the existense of the /settings child on the server account...")
-        if self.dbRoot.child(gcmPath + "/settings").get(shallow=True) is None:
-            localLog.debug("Child missing!")
-            localLog.debug("Attempting to add settings using default settings...")
-            try:
-                self.dbRoot.child(gcmPath + "/settings").update(self.dbRoot.child(defaultPath + "/settings").get())
-                self.log.info("Settings successfully added to Greger Client Module account from default!")
-            except Exception as e:
-                self.log.error("Oops! Failed to add settings to Greger Client Module account on server! - " + str(e))
-
-        # Does all settings exist?
+        # Get client account (children 'about' to 'settings', not timeseries)
+        # and default account
+        localLog.debug("Attempting to retrieve client and default accounts...")
+        try:
+            gcmAccount = self.backend.get(gcmPath, start="about", end="settings") or {}
+            defaultAccount = self.backend.get(defaultPath) or {}
+        except Exception as e:
+            self.log.error("Oops! Failed to retrieve accounts! - " + str(e))
+            return
+
+        # Find keys missing in client account
+        localLog.debug("Reviewing client account...")
+        missing = {}
+        if not gcmAccount:
+            localLog.debug("Client account is missing! Using GDB default account.")
+            missing.update(defaultAccount)
         else:
-            localLog.debug("Client account exists, with settings.")
-            localLog.debug("Checking that all settings are present in client account...")
-            localLog.debug("Attempting to retrieve settings...")
-            try:
-                defaultSettings = self.dbRoot.child(defaultPath + "/settings").get()
-                gcmSettings = self.dbRoot.child(gcmPath + "/settings").get()
-
-                localLog.debug("Settings retrieved. Reviewing all settings...")
-                for setting in defaultSettings:
-                    if setting not in gcmSettings:
-                        localLog.debug("Setting " + str(setting) + " not present, attempting to add setting to account...")
-                        try:
-                            self.dbRoot.child(gcmPath + "/settings/" + setting).update(defaultSettings[setting])
-                            self.log.info("Setting " + setting + " added to Greger Client Module account!")
-                        except Exception as e:
-                            self.log.error("Oops! Failed to write " + str(setting) + " to account! - " + str(e))
-                    else:
-                        localLog.debug("Setting " + str(setting) + " present!")
-
-            except Exception as e:
-                self.log.error("Oops! Failed to retrieve default settings! - " + str(e))
-
-        # Does settings exist?
-        localLog.debug("Checking the existense of the /about child on the server account...")
-        if self.dbRoot.child(gcmPath + "/about").get(shallow=True) is None:
-            localLog.debug("Child missing!")
-            localLog.debug("Attempting to add about using default...")
+            for child in ("settings", "about"):
+                defaultChild = defaultAccount.get(child) or {}
+                gcmChild = gcmAccount.get(child) or {}
+                for key in defaultChild:
+                    if key not in gcmChild:
+                        localLog.debug(child + "/" + str(key) + " not present in client account.")
+                        missing[child + "/" + key] = defaultChild[key]
+
+        # Add all missing keys at once
+        if missing:
+            localLog.debug("Attempting to add " + str(len(missing)) + " missing key(s) to client account...")
             try:
-                self.dbRoot.child(gcmPath + "/about").update(self.dbRoot.child(defaultPath + "/about").get())
-                self.log.info("About successfully added to Greger Client Module Account from default!")
+                self.backend.updateMany(gcmPath, missing)
+                self.log.info("Greger Client Module account updated from default! (" +
+                    ", ".join(sorted(missing)) + ")")
             except Exception as e:
-                self.log.error("Oops! Failed to add /about to Greger Client Module Account on server! - " + str(e))
+                self.log.error("Oops! Failed to update Greger Client Module account on server! - " + str(e))
+                return
+        else:
+            localLog.debug("Client account complete.")
 
-        # Update client root reference
-        localLog.debug("Attempting to get db reference to client account...")
-        self.dbGCMRoot = db.reference(gcmPath)
         localLog.debug("Client account review complete!")
 
+        # Apply settings of reviewed account
+        settings = dict(gcmAccount.get("settings") or {})
+        for key, value in missing.items():
+            if key == "settings":
+                settings.update(value)
+            elif key.startswith("settings/"):
+                settings[key[len("settings/"):]] = value
+        self._applySettings(settings)
+
         self._accountReviewedOK = True
 
     def _getSettings(self):
@@ -197,63 +254,167 @@ class GregerDatabase(Thread):
         localLog.debug("Ensuring client has a reviewed account...")
         if not self._accountReviewedOK:
             localLog.debug("Client not reviewed...")
-            localLog.debug("Attempting to (re-)setup account for " + gcmName + "...")
+            localLog.debug("Attempting to (re-)setup account...")
             self._setupAccount()
+
+            # Settings retrieved with account
+            if self._accountReviewedOK:
+                return self.settings
         else:
             localLog.debug("Client account OK!")
 
         # Get new settings
         localLog.debug("Attempting to retrieve new/updated settings...")
-        oldSettings = self.settings.copy()
         try:
-            GregerDatabase.settings = self.dbGCMRoot.child("settings").get()
+            newSettings = self.backend.get(self.gcmPath + "/settings")
             localLog.debug("Settings successfully retrieved!")
         except Exception as e:
             self.log.error("Oops! Failed to retrieve settings. - " + str(e))
-            localLog.debug("Attempting to re-setup account for " + gcmName + "...")
+            localLog.debug("Attempting to re-setup account...")
             self._setupAccount()
+            return self.settings
+
+        self._applySettings(newSettings)
+        localLog.debug("Settings retrieved successfully!")
+
+        return self.settings
+
+    def _applySettings(self, newSettings, save=True):
+        '''
+        Replace settings with new settings (atomic swap), logging changes and
+        saving them to local disk.
+        '''
+        localLog = logging.getLogger(self.logPath + "._applySettings")
+
+        # Check new settings and update typed settings (calls subscribers of
+        # changed settings) before replacing settings
+        newSettings = self._checkSettings(newSettings)
+        GregerDatabase.options.refresh(newSettings)
+
+        with self._settingsLock:
+            oldSettings = self.settings.copy()
+            GregerDatabase.settings = newSettings
+
+        if save and newSettings and newSettings != oldSettings:
+            self._saveSettings(newSettings)
 
         try:
-            if 'logLevel' in oldSettings:
-                if oldSettings['logLevel']['value'] != self.settings['logLevel']['value']:
+            if 'logLevel' in newSettings:
+                if oldSettings.get('logLevel', {}).get('value') != newSettings['logLevel']['value']:
                     # Update log level
                     self.log.info("Updating logging level...")
-                    setLogLevel(self.settings['logLevel']['value'])
-            else:
-                # Update log level
-                self.log.info("Updating logging level...")
-                setLogLevel(self.settings['logLevel']['value'])
+                    setLogLevel(newSettings['logLevel']['value'])
         except:
             pass
 
         # Checking settings for updates...
         localLog.debug("Checking settings...")
-        if oldSettings == self.settings:
+        if oldSettings == newSettings:
             localLog.debug("No new settings detected!")
         else:
             self.log.info("New/updated settings detected!")
-            for setting in sorted(self.settings):
+            for setting in sorted(newSettings):
                 if setting in oldSettings:
-                    if oldSettings[setting] != self.settings[setting]:
-                        self.log.info("Changed setting: (" +
-                            self.settings[setting]['moduleID'] + ") " +
-                            self.settings[setting]['name'] + " = " +
-                            str(self.settings[setting]['value']))
+                    if oldSettings[setting] != newSettings[setting]:
+                        self.log.info("Changed setting: " + self._describeSetting(setting, newSettings[setting]))
                 elif oldSettings == {}:
-                    self.log.info("Setting detected: (" +
-                        self.settings[setting]['moduleID'] + ") " +
-                        self.settings[setting]['name'] + " = " +
-                        str(self.settings[setting]['value']))
+                    self.log.info("Setting detected: " + self._describeSetting(setting, newSettings[setting]))
                 else:
-                    self.log.info("New setting: (" +
-                        self.settings[setting]['moduleID'] + ") " +
-                        self.settings[setting]['name'] + " = " +
-                        str(self.settings[setting]['value']))
+                    self.log.info("New setting: " + self._describeSetting(setting, newSettings[setting]))
             localLog.debug("All settings checked!")
 
-        localLog.debug("Settings retrieved successfully!")
+    def _describeSetting(self, setting, entry):
+        '''
+        Setting as "(moduleID) name = value" for logging.
+        '''
+        return ("(" + str(entry.get('moduleID', '?')) + ") " + str(entry.get('name', setting)) +
+            " = " + str(entry.get('value')))
 
-        return self.settings
+    def _checkSettings(self, newSettings):
+        '''
+        Settings with a value, leaving out (and logging) malformed settings.
+        '''
+        if newSettings is None:
+            return {}
+        if not isinstance(newSettings, dict):
+            raise ValueError("Settings is not a node! - " + str(newSettings))
+
+        checkedSettings = {}
+        for setting, entry in newSettings.items():
+            if isinstance(entry, dict) and 'value' in entry:
+                checkedSettings[setting] = entry
+            else:
+                self.log.warning("Oops! Malformed setting ignored! - " + str(setting) +
+                    " = " + str(entry))
+        return checkedSettings
+
+    def _settingsEvent(self, event):
+        '''
+        Apply settings change event from settings stream (put or patch of
+        data at path relative to settings).
+        '''
+        localLog = logging.getLogger(self.logPath + "._settingsEvent")
+        localLog.debug("Settings " + str(event.event_type) + " at " + str(event.path) + ".")
+
+        try:
+            keys = [key for key in event.path.split('/') if key]
+            if not keys and event.event_type == 'put':
+                newSettings = event.data or {}
+            else:
+                newSettings = copy.deepcopy(self.settings)
+                if event.event_type == 'put':
+                    self._setNode(newSettings, keys, event.data)
+                else:
+                    # Patch keys are paths relative to event path
+                    for key, value in (event.data or {}).items():
+                        self._setNode(newSettings, keys + [k for k in key.split('/') if k], value)
+            self._applySettings(newSettings)
+
+        except Exception as e:
+            self.log.error("Oops! Failed to apply settings change! - " + str(e))
+
+    def _setNode(self, tree, keys, value):
+        '''
+        Set value at path keys (non-empty) of tree, None deletes.
+        '''
+        node = tree
+        for key in keys[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        if value is None:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+
+    def _startSettingsStream(self):
+        '''
+        Subscribe to settings change events.
+        '''
+        try:
+            self._settingsStream = self.backend.listen(self.gcmPath + "/settings", self._settingsEvent)
+            self.log.info("Streaming settings from Greger Database.")
+        except Exception as e:
+            self.log.warning("Oops! Failed to stream settings! (polling) - " + str(e))
+            self._settingsStream = None
+
+    def _stopSettingsStream(self):
+        '''
+        Unsubscribe from settings change events.
+        '''
+        if self._settingsStream is None:
+            return
+        try:
+            self._settingsStream.close()
+        except Exception as e:
+            self.log.warning("Oops! Failed to close settings stream! - " + str(e))
+        self._settingsStream = None
+
+    def _settingsStreamAlive(self):
+        '''
+        Check if settings stream is running.
+        '''
+        return self._settingsStream is not None and self._settingsStream.isAlive()
 
     # def _getAbout(self):
     #     '''
@@ -309,14 +470,83 @@ class GregerDatabase(Thread):
     def update(self, path, value):
         '''
         Update Greger Client Module account child with value at path.
+
+        Returns True if the update was confirmed by the server (or queued).
         '''
         localLog = logging.getLogger(self.logPath + ".update")
 
+        if self.queue is not None:
+            return path in self.updateMany([(path, value)])
+
         localLog.debug("Attempting to update client account child...")
         try:
-            self.dbGCMRoot.child(path).update(value)
+            self.backend.update(self.gcmPath + "/" + path, value)
+            return True
         except Exception as e:
             self.log.error("Oops! Failed to update child! - " + str(e))
+            return False
+
+    def updateMany(self, updates, maxBatchSize=None):
+        '''
+        Update several Greger Client Module account children, given as a list
+        of (path, value). The children of each value are merged at path, as
+        by update(), in multi-path updates of the client account of at most
+        maxBatchSize children each (setting gdbMaxBatchSize, 0 = unlimited).
+
+        With an outbound queue, updates are queued on disk and sent in order,
+        as long as the server confirms them.
+
+        Returns set of paths confirmed by the server (or queued).
+        '''
+        localLog = logging.getLogger(self.logPath + ".updateMany")
+
+        if self.queue is None:
+            return self._updateMany(updates, maxBatchSize)
+
+        try:
+            self.queue.put(updates)
+        except Exception as e:
+            self.log.error("Oops! Failed to queue updates! (updating directly) - " + str(e))
+            return self._updateMany(updates, maxBatchSize)
+
+        # Send queued updates, oldest first
+        self.queue.replay(lambda chunk: self._updateMany(chunk, maxBatchSize),
+            self.options.gdqReplayChunkSize)
+        localLog.debug(str(len(self.queue)) + " update(s) left in queue.")
+        return set(path for path, value in updates)
+
+    def _updateMany(self, updates, maxBatchSize=None):
+        '''
+        Send multi-path updates to server, see updateMany().
+
+        Returns set of paths confirmed by the server.
+        '''
+        localLog = logging.getLogger(self.logPath + "._updateMany")
+
+        if maxBatchSize is None:
+            maxBatchSize = self.options.gdbMaxBatchSize
+
+        # One multi-path entry per child
+        children = []
+        for path, value in updates:
+            for child in value:
+                children.append((path, path + "/" + str(child), value[child]))
+        if not maxBatchSize:
+            maxBatchSize = max(len(children), 1)
+
+        localLog.debug("Attempting to update " + str(len(children)) + " client account children in " +
+            str((len(children) + maxBatchSize - 1) // maxBatchSize) + " batch(es)...")
+        failed = set()
+        for i in range(0, len(children), maxBatchSize):
+            batch = children[i:i + maxBatchSize]
+            try:
+                self.backend.updateMany(self.gcmPath,
+                    dict((childPath, value) for path, childPath, value in batch))
+            except Exception as e:
+                self.log.error("Oops! Failed to update children! - " + str(e))
+                failed.update(path for path, childPath, value in batch)
+
+        return set(path for path, value in updates) - failed
 
     def run(self):
         '''
@@ -332,12 +562,36 @@ class GregerDatabase(Thread):
             loopCount += 1
             localLog.debug("Checking for updates (" + str(loopCount) + ")...")
 
-            # Get server updates...
-            self._getSettings()
+            # Get server updates (streamed, or polled as fallback)...
+            try:
+                if self.options.gdbStreamSettings:
+                    if not self._settingsStreamAlive():
+                        if self._settingsStream is not None:
+                            self.log.warning("Settings stream dropped! (polling)")
+                            self._stopSettingsStream()
+                        self._getSettings()
+                        self._startSettingsStream()
+                else:
+                    self._stopSettingsStream()
+                    self._getSettings()
+            except Exception as e:
+                self.log.warning("Oops! Failed to get updates from Greger Database! - " + str(e))
             # self._getAbout()
 
             # Wait update delay
-            localLog.debug("Waiting " + str(self.settings['gdbCheckUpdateDelay']['value']) + "s...")
-            self.stopExecution.wait(self.settings['gdbCheckUpdateDelay']['value'])
+            checkUpdateDelay = self.options.gdbCheckUpdateDelay
+            localLog.debug("Waiting " + str(checkUpdateDelay) + "s...")
+            self.stopExecution.wait(checkUpdateDelay)
+
+        # Stop settings stream
+        self._stopSettingsStream()
+
+        # Close outbound queue
+        if self.queue is not None:
+            self.queue.close()
+
+        # Close storage backend
+        if self.backend is not None:
+            self.backend.close()
 
         self.log.info("Greger Database (GDB) execution stopped!")
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Greger Database Queue (GDQ) - Durable outbound queue of updates to the
+Greger Database (GDB), kept on disk (SQLite) while the database is
+unreachable.
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import os, time
+import json
+import logging
+import sqlite3
+from threading import Lock
+from threading import Timer
+
+class GregerDatabaseQueue(object):
+    '''
+    Append-only queue of (path, value) updates in an SQLite database.
+
+    Updates are committed (fsync) as a group at most every commitInterval
+    seconds, to limit SD card wear. A timer commits pending updates at the
+    latest commitInterval seconds after the first of them. The oldest
+    updates are dropped when the queue exceeds maxBytes.
+    '''
+
+    def __init__(self, path, maxBytes=50000000, commitInterval=5.0):
+        '''
+        Initialize class
+        '''
+        # Logging
+        self.logPath = "root.GDQ"
+        self.log = logging.getLogger(self.logPath)
+        localLog = logging.getLogger(self.logPath + ".__init__")
+        localLog.debug("Initiating Greger Database Queue (GDQ)...")
+
+        # Instance variables
+        self.path = path
+        self.maxBytes = maxBytes
+        self.commitInterval = commitInterval
+        self._lock = Lock()
+        self._replayLock = Lock()
+        self._commitTime = time.time()
+        self._inTransaction = False
+        self._commitTimer = None
+
+        # Open database
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS outbound ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT, value TEXT, bytes INTEGER)")
+
+        # Output variable
+        depth, size = self._db.execute("SELECT COUNT(*), TOTAL(bytes) FROM outbound").fetchone()
+        self.metrics = {
+            'queueDepth': depth,
+            'queueBytes': int(size),
+            'queueDropped': 0,
+            'replayRate': 0
+            }
+
+        self.log.info("Greger Database Queue (GDQ) opened at " + path +
+            " (" + str(depth) + " queued updates).")
+
+    def __len__(self):
+        return self.metrics['queueDepth']
+
+    def _begin(self):
+        '''
+        Begin transaction, unless pending (group commit).
+        '''
+        if not self._inTransaction:
+            self._db.execute("BEGIN")
+            self._inTransaction = True
+
+            # Commit pending changes at the latest after commit interval
+            self._commitTimer = Timer(self.commitInterval, self._timedCommit)
+            self._commitTimer.daemon = True
+            self._commitTimer.start()
+
+    def _commit(self, force=False):
+        '''
+        Commit pending changes if commit interval has passed (group commit).
+        '''
+        if not self._inTransaction:
+            return
+        if force or time.time() - self._commitTime >= self.commitInterval:
+            self._db.execute("COMMIT")
+            self._commitTime = time.time()
+            self._inTransaction = False
+            if self._commitTimer is not None:
+                self._commitTimer.cancel()
+                self._commitTimer = None
+
+    def _timedCommit(self):
+        '''
+        Commit pending changes (commit timer).
+        '''
+        with self._lock:
+            try:
+                self._commit(force=True)
+            except sqlite3.Error as e:
+                self.log.warning("Oops! Failed to commit queue! - " + str(e))
+
+    def put(self, updates):
+        '''
+        Append updates, list of (path, value).
+        '''
+        rows = []
+        for path, value in updates:
+            data = json.dumps(value)
+            rows.append((path, data, len(path) + len(data)))
+
+        with self._lock:
+            self._begin()
+            self._db.executemany("INSERT INTO outbound (path, value, bytes) VALUES (?, ?, ?)", rows)
+            self.metrics['queueDepth'] += len(rows)
+            self.metrics['queueBytes'] += sum(row[2] for row in rows)
+
+            # Bound disk usage - drop oldest updates
+            if self.maxBytes and self.metrics['queueBytes'] > self.maxBytes:
+                self._dropOldest(self.metrics['queueBytes'] - self.maxBytes)
+
+            self._commit()
+
+    def _dropOldest(self, nbytes):
+        '''
+        Drop oldest updates of at least nbytes in total.
+        '''
+        dropped = 0
+        droppedBytes = 0
+        lastId = None
+        for id, size in self._db.execute("SELECT id, bytes FROM outbound ORDER BY id"):
+            lastId = id
+            dropped += 1
+            droppedBytes += size
+            if droppedBytes >= nbytes:
+                break
+        if lastId is None:
+            return
+
+        self._db.execute("DELETE FROM outbound WHERE id <= ?", (lastId,))
+        self.metrics['queueDepth'] -= dropped
+        self.metrics['queueBytes'] -= droppedBytes
+        self.metrics['queueDropped'] += dropped
+        self.log.warning("Queue full! Dropped " + str(dropped) + " oldest update(s).")
+
+    def peek(self, count):
+        '''
+        Oldest updates, list of (id, path, value), without removing them.
+        '''
+        with self._lock:
+            rows = self._db.execute("SELECT id, path, value FROM outbound ORDER BY id LIMIT ?",
+                (count,)).fetchall()
+        return [(id, path, json.loads(value)) for id, path, value in rows]
+
+    def remove(self, lastId):
+        '''
+        Remove updates up to and including id lastId (sent).
+        '''
+        with self._lock:
+            removed, removedBytes = self._db.execute(
+                "SELECT COUNT(*), TOTAL(bytes) FROM outbound WHERE id <= ?", (lastId,)).fetchone()
+            self._begin()
+            self._db.execute("DELETE FROM outbound WHERE id <= ?", (lastId,))
+            self.metrics['queueDepth'] -= removed
+            self.metrics['queueBytes'] -= int(removedBytes)
+            self._commit()
+
+    def replay(self, send, chunkSize=1000):
+        '''
+        Send queued updates in order, in chunks of chunkSize. Send is called
+        with a list of (path, value) and returns the set of paths confirmed.
+        Replay stops at the first update not confirmed. One thread replays
+        at a time, others wait, so that no chunk is sent twice or out of
+        order.
+
+        Returns number of updates sent.
+        '''
+        localLog = logging.getLogger(self.logPath + ".replay")
+        sent = 0
+
+        with self._replayLock:
+            startTime = time.time()
+            while True:
+                chunk = self.peek(chunkSize)
+                if not chunk:
+                    break
+                confirmed = send([(path, value) for id, path, value in chunk])
+
+                # Remove confirmed updates, up to the first failed one (order)
+                lastId = None
+                for id, path, value in chunk:
+                    if path not in confirmed:
+                        break
+                    lastId = id
+                    sent += 1
+                if lastId is not None:
+                    self.remove(lastId)
+                if lastId != chunk[-1][0]:
+                    break
+
+        if sent:
+            self.metrics['replayRate'] = round(sent / max(time.time() - startTime, 1e-3), 1)
+            localLog.debug(str(sent) + " queued update(s) sent, " + str(len(self)) + " left.")
+        return sent
+
+    def close(self):
+        '''
+        Commit pending changes and close queue.
+        '''
+        with self._lock:
+            timer = self._commitTimer
+            self._commit(force=True)
+            self._db.close()
+
+        # Wait for commit timer (cancelled) to end
+        if timer is not None:
+            timer.join()
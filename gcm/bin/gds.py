@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Greger Database Settings (GDS) - Typed settings of the Greger Client Module,
+converted once per settings refresh from the Greger Database (GDB) settings.
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import logging
+from threading import Lock
+
+def _bool(value):
+    '''
+    Convert setting value to bool (accepting "true"/"false" strings).
+    '''
+    if isinstance(value, basestring):
+        if value.strip().lower() in ('true', 'yes', 'on', '1'):
+            return True
+        if value.strip().lower() in ('false', 'no', 'off', '0', ''):
+            return False
+        raise ValueError("Not a boolean! - " + value)
+    return bool(value)
+
+def _lower(value):
+    '''
+    Convert setting value to lower case string.
+    '''
+    return str(value or '').lower()
+
+# Typed settings - name: (converter, default)
+_schema = {
+    # Greger Client Module (GCM)
+    'gcmEnableOWD': (_bool, False),
+    'gcmCyclePeriod': (float, 1.0),
+    'gcmTimeseriesEncoding': (_lower, ''),
+    'gcmTimeseriesChunkSize': (int, 60),
+    'gcmTimeseriesChunkAge': (float, 600.0),
+
+    # Greger Database (GDB) and Queue (GDQ)
+    'gdbCheckUpdateDelay': (float, 10.0),
+    'gdbStreamSettings': (_bool, False),
+    'gdbMaxBatchSize': (int, 500),
+    'gdqReplayChunkSize': (int, 1000),
+
+    # Greger Update Agent (GUA)
+    'guaSWSource': (str, ''),
+    'guaCheckUpdateDelay': (float, 10.0),
+
+    # Greger Publish Agent (GPA)
+    'gpaQueueSize': (int, 10),
+    'gpaOverflowPolicy': (str, 'coalesce'),
+
+    # 1-Wire Devices (OWD)
+    'owdEnableTimeseries': (_bool, True),
+    'owdEnableStrftime': (_bool, False),
+    'owdSensorResolution': (int, 1),
+    'owdSimultaneousConversion': (_bool, False),
+    'owdRescanInterval': (float, 60.0),
+    'owdReadThreads': (int, 1),
+    'owdReadTimeout': (float, 5.0),
+    'owdTimeseriesBucketType': (_lower, 's'),
+    'owdTimeseriesBucketSize': (int, 1),
+    'owdTimeseriesMaxAge': (int, 86400),
+    'owdTimeseriesMaxPoints': (int, 0),
+    'owdRollupTiers': (str, ''),
+    'owdCompression': (_lower, ''),
+    'owdCompressionTolerance': (float, 0.1),
+    'owdCompressionMaxHold': (float, 300.0),
+    'owdAdaptiveSampling': (_bool, False),
+    'owdDeadband': (float, 0.1),
+    'owdMinPollInterval': (float, 1.0),
+    'owdMaxPollInterval': (float, 60.0),
+    'owdAlarmSearch': (_bool, False),
+    'owdAlarmBand': (float, 1.0),
+    'owdAlarmSweepInterval': (float, 300.0)
+}
+
+class GregerSettings(object):
+    '''
+    Typed settings as attributes, e.g. settings.owdReadThreads. Values are
+    validated and converted on refresh, invalid or missing settings are
+    replaced by their defaults.
+
+    Callbacks subscribed to a set of keys are called, with the set of keys
+    changed, when any of them changes.
+    '''
+
+    def __init__(self, schema=None):
+        '''
+        Initialize class
+        '''
+        # Logging
+        self.logPath = "root.GDS"
+        self.log = logging.getLogger(self.logPath)
+
+        # Instance variables
+        self._schema = schema if schema is not None else _schema
+        self._lock = Lock()
+        self._subscribers = []      # List of (keys, callback)
+
+        # Defaults until first refresh
+        for name, (converter, default) in self._schema.items():
+            setattr(self, name, default)
+
+    def refresh(self, settings):
+        '''
+        Convert GDB settings, dict of {name: {'value': value, ...}}, and call
+        subscribers of the keys changed. Returns the set of keys changed.
+        '''
+        localLog = logging.getLogger(self.logPath + ".refresh")
+
+        # Convert all settings before updating any attribute
+        values = {}
+        for name, (converter, default) in self._schema.items():
+            try:
+                setting = settings[name]
+            except (KeyError, TypeError):
+                values[name] = default
+                continue
+            try:
+                values[name] = converter(setting['value'])
+            except (KeyError, TypeError, ValueError) as e:
+                self.log.warning("Oops! Invalid setting " + name + " (using " +
+                    str(default) + ") - " + str(e))
+                values[name] = default
+
+        # Update attributes
+        with self._lock:
+            changed = set(name for name in values if values[name] != getattr(self, name))
+            for name in changed:
+                setattr(self, name, values[name])
+            subscribers = list(self._subscribers)
+
+        # Notify subscribers
+        for keys, callback in subscribers:
+            keysChanged = changed & keys
+            if keysChanged:
+                try:
+                    callback(keysChanged)
+                except Exception as e:
+                    self.log.warning("Oops! Settings callback failed! - " + str(e))
+
+        if changed:
+            localLog.debug("Settings changed: " + ", ".join(sorted(changed)))
+        return changed
+
+    def subscribe(self, keys, callback):
+        '''
+        Call callback, with the set of keys changed, when any of keys change.
+        '''
+        keys = set(keys)
+        unknown = keys - set(self._schema)
+        if unknown:
+            raise KeyError("Unknown setting(s)! - " + ", ".join(sorted(unknown)))
+        with self._lock:
+            self._subscribers.append((keys, callback))
+
+    def unsubscribe(self, callback):
+        '''
+        Remove all subscriptions of callback.
+        '''
+        with self._lock:
+            self._subscribers = [(keys, subscriber) for keys, subscriber in self._subscribers
+                if subscriber != callback]
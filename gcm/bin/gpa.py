@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Greger Publish Agent (GPA) module for the Greger Client Module - publishes
+updates to the Greger Database (GDB) in the background, so that sampling is
+not delayed by the network.
+"""
+
+__author__ = "Eric Sandbling"
+__license__ = 'MIT'
+__status__ = 'Development'
+
+# System modules
+import time
+import copy
+import logging
+from collections import deque
+from threading import Event
+from threading import Thread
+from threading import Condition
+
+# Local Modules
+from gdb import GregerDatabase
+
+# Overflow policies of the publish queue
+_overflowPolicies = ('coalesce', 'block', 'dropOldest')
+
+class publishJob(object):
+    '''
+    Updates, list of (path, value), of one or more (coalesced) cycles, with
+    callbacks called with the set of paths confirmed.
+    '''
+
+    __slots__ = ('updates', 'callbacks', 'time')
+
+    def __init__(self, updates, callback=None):
+        '''
+        Initialize class
+        '''
+        self.updates = updates
+        self.callbacks = [callback] if callback is not None else []
+        self.time = time.time()
+
+    def merge(self, other):
+        '''
+        Merge newer job into this one. The children of values at the same
+        path are merged, newer replacing older, as when updated in order.
+        '''
+        values = dict(self.updates)
+        for path, value in other.updates:
+            if path in values:
+                values[path].update(value)
+            else:
+                values[path] = value
+                self.updates.append((path, value))
+        self.callbacks += other.callbacks
+
+class GregerPublishAgent(Thread):
+    """
+    Publish updates to GDB from a bounded queue in a worker thread.
+    """
+
+    def __init__(self, database):
+        '''
+        Initialize the main class
+        '''
+        Thread.__init__(self)
+        self.database = database
+
+        # Setup logging
+        self.logPath = "root.GPA"
+        self.log = logging.getLogger(self.logPath)
+        localLog = logging.getLogger(self.logPath + ".__init__")
+        localLog.debug("Initiating Greger Publish Agent (GPA)...")
+
+        # Stop execution handler
+        self.stopExecution = Event()
+
+        # Publish queue
+        self._jobs = deque()
+        self._condition = Condition()
+        self._activeTime = None     # Epoch of job being published
+
+        # Output variable
+        self.metrics = {
+            'queueLength': 0,
+            'lag': 0,
+            'published': 0,
+            'coalesced': 0,
+            'dropped': 0
+            }
+
+        self.log.info("Greger Publish Agent (GPA) successfully initiated!")
+
+    def publish(self, updates, callback=None):
+        '''
+        Queue updates, list of (path, value), for publishing. Callback is
+        called (from the agent thread) with the set of paths confirmed.
+
+        When the queue is full (setting gpaQueueSize), the overflow policy
+        (setting gpaOverflowPolicy) either coalesces the updates with the
+        newest queued ones, blocks until there is room, or drops the oldest
+        queued updates.
+        '''
+        localLog = logging.getLogger(self.logPath + ".publish")
+
+        queueSize = max(GregerDatabase.options.gpaQueueSize, 1)
+        policy = GregerDatabase.options.gpaOverflowPolicy
+        if policy not in _overflowPolicies:
+            localLog.warning("Unknown overflow policy! - " + str(policy) + " (coalescing)")
+            policy = 'coalesce'
+
+        # Own copy, values are merged when coalesced
+        job = publishJob(copy.deepcopy(updates), callback)
+
+        with self._condition:
+            if len(self._jobs) >= queueSize:
+                if policy == 'coalesce':
+                    self._jobs[-1].merge(job)
+                    self.metrics['coalesced'] += 1
+                    localLog.debug("Publish queue full, updates coalesced.")
+                    self._updateMetrics()
+                    return
+                elif policy == 'block':
+                    localLog.debug("Publish queue full, waiting...")
+                    while len(self._jobs) >= queueSize and not self.stopExecution.is_set():
+                        self._condition.wait(1)
+                else:
+                    self._jobs.popleft()
+                    self.metrics['dropped'] += 1
+                    self.log.warning("Publish queue full! Oldest updates dropped.")
+
+            self._jobs.append(job)
+            self._updateMetrics()
+            self._condition.notify_all()
+
+    def _updateMetrics(self):
+        '''
+        Update queue length and lag (age of oldest updates not published).
+        '''
+        self.metrics['queueLength'] = len(self._jobs)
+        oldest = self._activeTime or (self._jobs[0].time if self._jobs else None)
+        self.metrics['lag'] = round(time.time() - oldest, 3) if oldest else 0
+
+    def _next(self):
+        '''
+        Wait for and take next job (oldest first) from queue. Returns None if
+        stopped and queue is empty.
+        '''
+        with self._condition:
+            while not self._jobs:
+                if self.stopExecution.is_set():
+                    return None
+                self._condition.wait(1)
+            job = self._jobs.popleft()
+            self._activeTime = job.time
+            self._updateMetrics()
+            self._condition.notify_all()
+            return job
+
+    def stop(self):
+        '''
+        Stop agent, after publishing queued updates.
+        '''
+        self.stopExecution.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def run(self):
+        '''
+        Run Greger Publish Agent.
+        '''
+        # Logging
+        localLog = logging.getLogger(self.logPath + ".run")
+        self.log.info("Starting Greger Publish Agent (GPA)...")
+
+        while True:
+            job = self._next()
+            if job is None:
+                break
+
+            try:
+                confirmed = self.database.updateMany(job.updates)
+            except Exception as e:
+                self.log.warning("Oops! Failed to publish updates! - " + str(e))
+                confirmed = set()
+            self.metrics['published'] += 1
+            with self._condition:
+                self._activeTime = None
+                self._updateMetrics()
+
+            for callback in job.callbacks:
+                try:
+                    callback(confirmed)
+                except Exception as e:
+                    self.log.warning("Oops! Publish callback failed! - " + str(e))
+
+            localLog.debug(str(len(confirmed)) + " of " + str(len(job.updates)) + " update(s) confirmed.")
+
+        self.log.info("Greger Publish Agent (GPA) execution stopped!")
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Greger Storage Backends (GSB) - Storage of the Greger Database (GDB) tree:
+Firebase Realtime Database, local SQLite database or in-memory.
+
+Usage (throughput benchmark):
+    python gsb.py --backend sqlite --updates 1000 --children 20
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import os, time
+import json
+import copy
+import logging
+import sqlite3
+import argparse
+from threading import Lock
+
+# Firebase Python Admin SDK is optional (local backends)
+try:
+    import firebase_admin
+    from firebase_admin import credentials
+    from firebase_admin import db
+except ImportError:
+    firebase_admin = None
+
+# Local Modules
+from common import getConfigOption
+
+def _keys(path):
+    '''
+    Keys of path, e.g. 'a/b/' -> ['a', 'b'].
+    '''
+    return [key for key in (path or '').split('/') if key]
+
+def _join(path, child):
+    '''
+    Path of child of path.
+    '''
+    return '/'.join(_keys(path) + _keys(child))
+
+def _keyRange(node, start=None, end=None):
+    '''
+    Children of node with keys in [start, end] (ordered by key), or node
+    itself if no range is given.
+    '''
+    if not isinstance(node, dict) or (start is None and end is None):
+        return node
+    return dict((key, value) for key, value in node.items()
+        if (start is None or key >= start) and (end is None or key <= end)) or None
+
+class storageEvent(object):
+    '''
+    Change event of a listened path: 'put' (data replaced) or 'patch'
+    (children of data updated) at path, relative to the listened path.
+    '''
+
+    __slots__ = ('event_type', 'path', 'data')
+
+    def __init__(self, event_type, path, data):
+        '''
+        Initialize class
+        '''
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class storageListener(object):
+    '''
+    Registration of a listener, returned by listen().
+    '''
+
+    def __init__(self, close=None, isAlive=None):
+        '''
+        Initialize class
+        '''
+        self._close = close
+        self._isAlive = isAlive
+        self.closed = False
+
+    def close(self):
+        '''
+        Stop listening.
+        '''
+        self.closed = True
+        if self._close is not None:
+            self._close()
+
+    def isAlive(self):
+        '''
+        Check if listener still receives events.
+        '''
+        if self.closed:
+            return False
+        return self._isAlive() if self._isAlive is not None else True
+
+class storageBackend(object):
+    '''
+    Storage backend interface. Paths are '/' separated keys from the root of
+    the database tree, values are JSON compatible (dicts for nodes).
+    '''
+
+    name = ''
+
+    def get(self, path, start=None, end=None):
+        '''
+        Value at path (None if missing). With start and/or end, only the
+        children with keys in [start, end] (ordered by key).
+        '''
+        raise NotImplementedError
+
+    def update(self, path, value):
+        '''
+        Merge the children of value (dict) into the node at path.
+        '''
+        self.updateMany(path, value)
+
+    def updateMany(self, path, updates):
+        '''
+        Multi-path update, dict of {relative path: value}, replacing the
+        value at each path below path (None deletes). Atomic.
+        '''
+        raise NotImplementedError
+
+    def listen(self, path, callback):
+        '''
+        Call callback with a storageEvent for the value at path ('put' at
+        '/'), and for each change below path. Returns storageListener.
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+        Close backend.
+        '''
+        pass
+
+class firebaseBackend(storageBackend):
+    '''
+    Firebase Realtime Database (Firebase Admin Python SDK).
+    '''
+
+    name = 'firebase'
+
+    def __init__(self, uri, cert):
+        '''
+        Initialize class
+        '''
+        if firebase_admin is None:
+            raise ImportError("Firebase Admin Python SDK (firebase_admin) not installed!")
+        self.cred = credentials.Certificate(cert)
+        self.firebase_app = firebase_admin.initialize_app(self.cred, {'databaseURL': uri})
+
+    def get(self, path, start=None, end=None):
+        ref = db.reference(_join('', path) or '/')
+        if start is None and end is None:
+            return ref.get()
+        query = ref.order_by_key()
+        if start is not None:
+            query = query.start_at(start)
+        if end is not None:
+            query = query.end_at(end)
+        return query.get() or None
+
+    def update(self, path, value):
+        db.reference(_join('', path) or '/').update(value)
+
+    def updateMany(self, path, updates):
+        db.reference(_join('', path) or '/').update(updates)
+
+    def listen(self, path, callback):
+        registration = db.reference(_join('', path) or '/').listen(callback)
+
+        def isAlive():
+            thread = getattr(registration, '_thread', None)
+            return thread is None or thread.is_alive()
+
+        return storageListener(registration.close, isAlive)
+
+class _localBackend(storageBackend):
+    '''
+    Local storage, with listeners notified (in the updating thread) of
+    updates made through the backend.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        self.logPath = "root.GSB"
+        self.log = logging.getLogger(self.logPath)
+        self._lock = Lock()
+        self._listeners = []        # List of (keys, callback, listener)
+
+    def _read(self, keys):
+        '''
+        Value at path keys (called locked).
+        '''
+        raise NotImplementedError
+
+    def _write(self, writes):
+        '''
+        Replace value at path keys of each (keys, value), None deletes
+        (called locked, atomic).
+        '''
+        raise NotImplementedError
+
+    def get(self, path, start=None, end=None):
+        with self._lock:
+            return _keyRange(self._read(_keys(path)), start, end)
+
+    def updateMany(self, path, updates):
+        writes = [(_keys(_join(path, child)), copy.deepcopy(value))
+            for child, value in updates.items()]
+        with self._lock:
+            self._write(writes)
+            self._listeners = [entry for entry in self._listeners if not entry[2].closed]
+            listeners = list(self._listeners)
+
+        # Notify listeners of changes at, below or above listened path
+        for listenKeys, callback, listener in listeners:
+            for writeKeys, value in writes:
+                if listener.closed:
+                    break
+                if writeKeys[:len(listenKeys)] == listenKeys:
+                    event = storageEvent('put', '/' + '/'.join(writeKeys[len(listenKeys):]),
+                        copy.deepcopy(value))
+                elif listenKeys[:len(writeKeys)] == writeKeys:
+                    event = storageEvent('put', '/', self.get('/'.join(listenKeys)))
+                else:
+                    continue
+                try:
+                    callback(event)
+                except Exception as e:
+                    self.log.warning("Oops! Listener callback failed! - " + str(e))
+
+    def listen(self, path, callback):
+        listener = storageListener()
+        listenKeys = _keys(path)
+        with self._lock:
+            self._listeners.append((listenKeys, callback, listener))
+        callback(storageEvent('put', '/', self.get(path)))
+        return listener
+
+class memoryBackend(_localBackend):
+    '''
+    In-memory database tree (lost on exit), e.g. for tests and benchmarks.
+    '''
+
+    name = 'memory'
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        _localBackend.__init__(self)
+        self._tree = {}
+
+    def _read(self, keys):
+        node = self._tree
+        for key in keys:
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return copy.deepcopy(node) if node != {} else None
+
+    def _write(self, writes):
+        for keys, value in writes:
+            if not keys:
+                self._tree = value if isinstance(value, dict) else {}
+                continue
+            node = self._tree
+            for key in keys[:-1]:
+                if not isinstance(node.get(key), dict):
+                    node[key] = {}
+                node = node[key]
+            if value is None:
+                node.pop(keys[-1], None)
+            else:
+                node[keys[-1]] = value
+
+class sqliteBackend(_localBackend):
+    '''
+    Local SQLite database, storing each leaf value of the tree by path.
+    '''
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        '''
+        Initialize class
+        '''
+        _localBackend.__init__(self)
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS tree (path TEXT PRIMARY KEY, value TEXT)")
+
+    def _subtree(self, keys):
+        '''
+        SQL condition and arguments selecting the leaves at or below keys.
+        '''
+        if not keys:
+            return "1", ()
+        path = '/'.join(keys)
+        return "(path = ? OR (path >= ? AND path < ?))", (path, path + '/', path + '0')
+
+    def _read(self, keys):
+        condition, args = self._subtree(keys)
+        rows = self._db.execute("SELECT path, value FROM tree WHERE " + condition, args).fetchall()
+        if not rows:
+            return None
+        tree = {}
+        for path, value in rows:
+            leafKeys = _keys(path)[len(keys):]
+            if not leafKeys:
+                return json.loads(value)
+            node = tree
+            for key in leafKeys[:-1]:
+                node = node.setdefault(key, {})
+            node[leafKeys[-1]] = json.loads(value)
+        return tree
+
+    def _leaves(self, keys, value, leaves):
+        '''
+        Add (path, json value) of each leaf of value at keys to leaves.
+        '''
+        if isinstance(value, dict):
+            for key, child in value.items():
+                self._leaves(keys + _keys(str(key)), child, leaves)
+        elif value is not None:
+            leaves.append(('/'.join(keys), json.dumps(value)))
+
+    def _write(self, writes):
+        self._db.execute("BEGIN")
+        try:
+            for keys, value in writes:
+                # Replace subtree, and any leaf above it
+                condition, args = self._subtree(keys)
+                self._db.execute("DELETE FROM tree WHERE " + condition, args)
+                for i in range(1, len(keys)):
+                    self._db.execute("DELETE FROM tree WHERE path = ?", ('/'.join(keys[:i]),))
+                leaves = []
+                self._leaves(keys, value, leaves)
+                self._db.executemany("INSERT INTO tree (path, value) VALUES (?, ?)", leaves)
+            self._db.execute("COMMIT")
+        except:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# Backends selectable in configuration (greger_database/backend)
+_backends = ('firebase', 'sqlite', 'memory')
+
+def createBackend(config):
+    '''
+    Create storage backend from configuration section greger_database.
+    Local backends are seeded from a JSON file (seed) when empty.
+    '''
+    localLog = logging.getLogger("root.GSB.createBackend")
+
+    # Locally relevant parameters
+    name = getConfigOption(config, "greger_database", "backend", "firebase").lower()
+    localLog.debug("Parameter: (backend) " + name)
+
+    if name == 'firebase':
+        return firebaseBackend(config.get("greger_database", "uri"),
+            config.get("greger_database", "cert"))
+    elif name == 'sqlite':
+        backend = sqliteBackend(getConfigOption(config, "greger_database", "database",
+            "/var/lib/gcm/database.db"))
+    elif name == 'memory':
+        backend = memoryBackend()
+    else:
+        raise ValueError("Unknown storage backend! - " + name + " (" + ", ".join(_backends) + ")")
+
+    # Seed empty local database
+    seed = getConfigOption(config, "greger_database", "seed")
+    if seed and backend.get('') is None:
+        with open(seed, "r") as f:
+            backend.updateMany('', json.load(f))
+        localLog.info("Local database seeded from " + seed + ".")
+    return backend
+
+def benchmark(backend, updates, children):
+    '''
+    Time multi-path updates of children values each, and reads of the
+    updated node. Returns (updates/s, children/s, gets/s).
+    '''
+    startTime = time.time()
+    for i in range(updates):
+        backend.updateMany('benchmark', dict(('series%d/%d' % (child, i),
+            {'min': i, 'mean': i + 0.5, 'max': i + 1}) for child in range(children)))
+    updateTime = max(time.time() - startTime, 1e-6)
+
+    startTime = time.time()
+    gets = max(updates // 10, 1)
+    for i in range(gets):
+        backend.get('benchmark/series0')
+    getTime = max(time.time() - startTime, 1e-6)
+
+    return updates / updateTime, updates * children / updateTime, gets / getTime
+
+if __name__ == '__main__':
+    import ConfigParser
+    parser = argparse.ArgumentParser(description='Benchmark Greger Database storage backends.')
+    parser.add_argument('--backend', default='memory', help='Backend: ' + ', '.join(_backends) + ' (default memory).')
+    parser.add_argument('--database', default='/tmp/gsb-benchmark.db', help='SQLite database path.')
+    parser.add_argument('--uri', help='Firebase database URI.')
+    parser.add_argument('--cert', help='Firebase certificate.')
+    parser.add_argument('--updates', type=int, default=1000, help='Multi-path updates (default 1000).')
+    parser.add_argument('--children', type=int, default=20, help='Children per update (default 20).')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    config = ConfigParser.RawConfigParser()
+    config.add_section('greger_database')
+    for option in ('backend', 'database', 'uri', 'cert'):
+        if getattr(args, option) is not None:
+            config.set('greger_database', option, getattr(args, option))
+
+    backend = createBackend(config)
+    try:
+        updateRate, childRate, getRate = benchmark(backend, args.updates, args.children)
+    finally:
+        backend.updateMany('', {'benchmark': None})
+        backend.close()
+    print "%-10s %12s %14s %10s" % ('backend', 'updates/s', 'children/s', 'gets/s')
+    print "%-10s %12.1f %14.1f %10.1f" % (backend.name, updateRate, childRate, getRate)
@@ -113,10 +113,9 @@ class GregerUpdateAgent(Thread):
         localLog.debug("Attempting to retrieve software revision info...")
 
         # Locally relevant parameters
-        if 'guaSWSource' in GregerDatabase.settings:
-            guaSWServerURI = GregerDatabase.settings['guaSWSource']['value']
-        else:
-            self.log.warning("Setting " + str(guaSWSource) + " not defined!")
+        guaSWServerURI = GregerDatabase.options.guaSWSource
+        if not guaSWServerURI:
+            self.log.warning("Setting guaSWSource not defined!")
             return
         moduleReturn = {
             'revision': "",
@@ -188,12 +187,11 @@ class GregerUpdateAgent(Thread):
         targetPath = os.path.join(targetRoot, targetDir)
         localLog.debug("Target path: " + targetPath)
         localLog.debug("Retrieving relevant parameters from server...")
-        if 'guaSWSource' in GregerDatabase.settings:
-            guaSWServerURI = GregerDatabase.settings['guaSWSource']['value']
-            localLog.debug("Parameter: (guaSWSource) " + guaSWServerURI)
-        else:
-            self.log.warning("Setting " + str(guaSWSource) + " not defined!")
+        guaSWServerURI = GregerDatabase.options.guaSWSource
+        if not guaSWServerURI:
+            self.log.warning("Setting guaSWSource not defined!")
             return
+        localLog.debug("Parameter: (guaSWSource) " + guaSWServerURI)
 
         # Get software files from server
         localLog.debug("Getting software files from server...")
@@ -333,11 +331,7 @@ class GregerUpdateAgent(Thread):
                 self.log.info("Attemption to restart application...")
                 restart_program()
 
-            if 'guaCheckUpdateDelay' in GregerDatabase.settings:
-                delayTime = GregerDatabase.settings['guaCheckUpdateDelay']['value']
-            else:
-                delayTime = 10
-                self.log.warning("Settings not defined! (using default=10)")
+            delayTime = GregerDatabase.options.guaCheckUpdateDelay
 
             # Wait update delay
             self.log.info("Waiting " + str(delayTime) + "s...")
@@ -11,35 +11,614 @@ __author__ = "Eric Sandbling"
 __status__ = 'Development'
 
 # Modules goes here
-import ow
 import time, sys
+import math
 import logging
+import Queue
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+# 1-Wire C-extension (owpython) is optional, see ownet
+try:
+    import ow
+except ImportError:
+    ow = None
 
 # Local Modules
 from gdb import GregerDatabase as greger
-
-# Functions for each sensor type goes here.
-def _ds18b20(sensor,ndigits=1):
-    '''Return available sensor values.'''
-    data = {
-        'temperature': round(float(sensor.temperature),ndigits)
-    }
-    return data
-
-def _ds2438(sensor,ndigits=1):
-    '''Return available sensor values.'''
-    data = {
-        'temperature': round(float(sensor.temperature),ndigits),
-        'humidity': round(float(sensor.humidity),ndigits)
-    }
-    return data
-
-# Sensor library listing all defined sensors
-_sensorLib = {
-    'ds18b20': _ds18b20,
-    'ds2438': _ds2438
+from ownet import owNetClient
+from ownet import owNetSensor
+from common import getLocalConfig
+from common import getConfigOption
+from tsd import bucketStats
+from tsd import timeseriesRetention
+from tsd import bucketBoundary
+from tsd import bucketWidth
+from tsd import rollupTier
+from tsd import parseRollupTiers
+from tsd import timeseriesCompressor
+
+# Settings reconfiguring owDevices when changed
+_reconfigureSettings = ('owdRollupTiers', 'owdCompression', 'owdCompressionTolerance',
+    'owdCompressionMaxHold', 'owdDeadband', 'owdMinPollInterval', 'owdMaxPollInterval')
+
+# Conversion time of a 12-bit DS18B20 temperature conversion (s)
+_conversionTime = 0.75
+
+# Value converters for driver attributes
+_converters = {
+    'float': lambda value, ndigits: round(float(value), ndigits),
+    'int': lambda value, ndigits: int(float(value)),
+    'bool': lambda value, ndigits: bool(int(float(value)))
 }
 
+class owDriver(object):
+    '''
+    Sensor driver for a 1-Wire device type, declaring the attributes read
+    from the device and the type of their values.
+    '''
+
+    def __init__(self, type, attributes, latched=None, cost=0.01, alarm=None):
+        '''
+        Initialize class. Attributes is a list of (name, path, converter),
+        latched maps names to paths reading the result of the last
+        simultaneous conversion, cost is the estimated read time (s) and
+        alarm is (name, highPath, lowPath) of the alarm thresholds of the
+        attribute name, if the device supports conditional (alarm) search.
+        '''
+        self.type = type.upper()
+        self.attributes = attributes
+        self.latched = latched or {}
+        self.cost = cost
+        self.alarm = alarm
+
+        for name, path, converter in attributes:
+            if converter not in _converters:
+                raise ValueError("Unknown converter for " + self.type + "/" + path + "! - " + str(converter))
+
+    def paths(self, latched=False):
+        '''
+        Attribute paths to read from device.
+        '''
+        if latched:
+            return [self.latched.get(name, path) for name, path, converter in self.attributes]
+        return [path for name, path, converter in self.attributes]
+
+    def convert(self, values, ndigits=1):
+        '''
+        Convert values read (strings, in order of paths) to sensor data.
+        '''
+        data = {}
+        for (name, path, converter), value in zip(self.attributes, values):
+            data[name] = _converters[converter](value, ndigits)
+        return data
+
+    def read(self, sensor, ndigits=1, latched=False):
+        '''
+        Read all attributes of sensor, in one batched request if supported.
+        '''
+        paths = self.paths(latched)
+        startTime = time.time()
+        if hasattr(sensor, 'readMany'):
+            values = sensor.readMany(paths)
+        else:
+            # ow.Sensor attribute names use '_' in place of '.'
+            values = [getattr(sensor, path.replace('.', '_')) for path in paths]
+        self.updateCost(time.time() - startTime)
+
+        return self.convert(values, ndigits)
+
+    def setAlarm(self, sensor, low, high):
+        '''
+        Program alarm thresholds of sensor.
+        '''
+        name, highPath, lowPath = self.alarm
+        setattr(sensor, highPath.replace('.', '_'), str(high))
+        setattr(sensor, lowPath.replace('.', '_'), str(low))
+
+    def getAlarm(self, sensor):
+        '''
+        Read alarm thresholds (low, high) programmed in sensor.
+        '''
+        name, highPath, lowPath = self.alarm
+        if hasattr(sensor, 'readMany'):
+            high, low = sensor.readMany([highPath, lowPath])
+        else:
+            high = getattr(sensor, highPath.replace('.', '_'))
+            low = getattr(sensor, lowPath.replace('.', '_'))
+        return (int(float(low)), int(float(high)))
+
+    def updateCost(self, readTime):
+        '''
+        Update read cost profile (moving average of read time).
+        '''
+        self.cost += 0.1 * (readTime - self.cost)
+
+# Driver library listing all defined sensors (by lower case type)
+_driverLib = {}
+
+def registerDriver(driver):
+    '''
+    Add driver to driver library, replacing any driver of the same type.
+    '''
+    _driverLib[driver.type.lower()] = driver
+
+def getDriver(deviceType):
+    '''
+    Get driver for device type, or None if not defined.
+    '''
+    return _driverLib.get(str(deviceType).lower())
+
+def parseDriver(deviceType, attributes, latched='', cost=0.01, alarm=''):
+    '''
+    Create driver from configuration strings. Attributes is a comma separated
+    list of [<name>=]<path>[:<converter>], e.g. "counter.A:int, counter.B:int".
+    Names default to the path, with '.' replaced by '_'. Alarm is
+    <name>:<highPath>:<lowPath>, e.g. "temperature:temphigh:templow".
+    '''
+    driverAttributes = []
+    for attribute in attributes.split(','):
+        if not attribute.strip():
+            continue
+        name, sep, path = attribute.strip().rpartition('=')
+        path, sep, converter = path.partition(':')
+        driverAttributes.append((
+            name.strip() or path.strip().replace('.', '_'),
+            path.strip(),
+            converter.strip() or 'float'))
+
+    driverLatched = {}
+    for attribute in latched.split(','):
+        if attribute.strip():
+            name, sep, path = attribute.strip().partition('=')
+            driverLatched[name.strip()] = path.strip()
+
+    driverAlarm = None
+    if alarm.strip():
+        driverAlarm = tuple(field.strip() for field in alarm.split(':'))
+        if len(driverAlarm) != 3:
+            raise ValueError("Invalid alarm for " + deviceType + "! - " + alarm)
+
+    return owDriver(deviceType, driverAttributes, driverLatched, float(cost), driverAlarm)
+
+def loadDrivers(config):
+    '''
+    Register drivers defined in configuration sections [owdriver:<type>],
+    with options ATTRIBUTES, LATCHED (optional), COST (optional) and ALARM
+    (optional).
+    '''
+    localLog = logging.getLogger("root.OWD.loadDrivers")
+    for section in config.sections():
+        if not section.lower().startswith('owdriver:'):
+            continue
+        deviceType = section.split(':', 1)[1].strip()
+        try:
+            registerDriver(parseDriver(deviceType,
+                config.get(section, 'attributes'),
+                getConfigOption(config, section, 'latched', ''),
+                getConfigOption(config, section, 'cost', 0.01),
+                getConfigOption(config, section, 'alarm', '')))
+            localLog.info("Driver registered from configuration: " + deviceType.upper())
+        except Exception as e:
+            localLog.error("Oops! Failed to register driver " + deviceType + "! - " + str(e))
+
+# Drivers goes here.
+registerDriver(owDriver('DS18B20',
+    [('temperature', 'temperature', 'float')],
+    # Result of last (simultaneous) conversion, no new conversion
+    latched={'temperature': 'latesttemp'},
+    cost=_conversionTime,
+    # Alarm thresholds (integer degrees C)
+    alarm=('temperature', 'temphigh', 'templow')))
+
+# The DS2438 converts in ~10ms on read, and has no latched reading.
+registerDriver(owDriver('DS2438',
+    [('temperature', 'temperature', 'float'),
+     ('humidity', 'humidity', 'float')],
+    cost=0.03))
+
+class owServerSession(object):
+    '''
+    Long-lived session to the 1-Wire server (owServer), caching the device
+    list between bus scans.
+
+    The session talks to owServer either through the 'ow' C-extension or
+    the pure Python 'ownet' client.
+    '''
+
+    def __init__(self, server='localhost:4304', backend=None, timeout=5.0):
+        '''
+        Initialize class
+        '''
+        # Logging
+        self.logPath = "root.OWD.session"
+        self.log = logging.getLogger(self.logPath)
+
+        # Instance variables
+        self.server = server
+        self.timeout = timeout
+        self.client = None
+        self.isConnected = False
+        self.deviceList = []
+        self._scanTime = 0              # Epoch
+        self._rescanRequested = True
+        self._reconnectRequested = False
+
+        # Backend, default to 'ow' if available
+        if backend is None:
+            backend = 'ow' if ow is not None else 'ownet'
+        if backend not in ('ow', 'ownet'):
+            self.log.error("Unknown owServer backend! - " + str(backend) + " (using ownet)")
+            backend = 'ownet'
+        elif backend == 'ow' and ow is None:
+            self.log.warning("Module 'ow' not available! (using ownet)")
+            backend = 'ownet'
+        self.backend = backend
+
+    def connect(self):
+        '''
+        Connect to owServer.
+        '''
+        localLog = logging.getLogger(self.logPath + ".connect")
+        localLog.debug("Connecting to owServer at " + self.server + " (" + self.backend + ")...")
+
+        if self.backend == 'ownet':
+            self.client = owNetClient.fromServer(self.server, self.timeout)
+            self.client.connect()
+        else:
+            ow.init(self.server)
+            ow.Sensor('/').useCache(False)
+        self.isConnected = True
+        self._rescanRequested = True
+        self._reconnectRequested = False
+
+        self.log.info("Connected to owServer at " + self.server + ".")
+
+    def close(self):
+        '''
+        Flush and stop connection to owServer.
+        '''
+        localLog = logging.getLogger(self.logPath + ".close")
+        if not self.isConnected:
+            return
+
+        localLog.debug("Stopping owServer connection...")
+        try:
+            if self.backend == 'ownet':
+                self.client.closeAll()
+            else:
+                ow.finish()
+        except Exception as e:
+            self.log.warning("Oops! Failed to stop owServer connection! - " + str(e))
+        self.isConnected = False
+
+    def release(self):
+        '''
+        Close connection of calling thread (ownet opens one per thread), e.g.
+        before a worker thread exits.
+        '''
+        if self.backend == 'ownet' and self.client is not None:
+            self.client.close()
+
+    def reconnect(self):
+        '''
+        Close and re-open connection to owServer (e.g. after owServer restart).
+        '''
+        self.log.info("Reconnecting to owServer...")
+        self.close()
+        self.connect()
+
+    def convertAll(self):
+        '''
+        Start a simultaneous temperature conversion on all devices on the bus
+        and wait for it to complete.
+        '''
+        localLog = logging.getLogger(self.logPath + ".convertAll")
+        localLog.debug("Starting simultaneous temperature conversion...")
+
+        if not self.isConnected:
+            self.connect()
+
+        startTime = time.time()
+        if self.backend == 'ownet':
+            self.client.write('/simultaneous/temperature', '1')
+        else:
+            ow._put('/simultaneous/temperature', '1')
+
+        # Wait for conversion to complete (if owServer did not already)
+        time.sleep(max(_conversionTime - (time.time() - startTime), 0))
+        localLog.debug("Simultaneous temperature conversion done.")
+
+    def invalidate(self, reconnect=False):
+        '''
+        Request a new bus scan (and optionally a reconnect) on next call to
+        devices(), e.g. after a failed read.
+        '''
+        self._rescanRequested = True
+        self._reconnectRequested = self._reconnectRequested or reconnect
+
+    def devices(self, rescanInterval=0):
+        '''
+        Return (cached) device list. The bus is re-scanned if older than
+        rescanInterval seconds or if a re-scan has been requested.
+        '''
+        localLog = logging.getLogger(self.logPath + ".devices")
+
+        # Ensure connection
+        if not self.isConnected:
+            self.connect()
+        elif self._reconnectRequested:
+            self.reconnect()
+
+        # Re-scan bus if required
+        if self._rescanRequested or time.time() - self._scanTime >= rescanInterval:
+            self._scan()
+        else:
+            localLog.debug("Using cached device list (" + str(len(self.deviceList)) + " devices).")
+
+        return self.deviceList
+
+    def alarmDevices(self):
+        '''
+        List ids of devices in alarm state (conditional search, owServer
+        /alarm directory).
+        '''
+        if not self.isConnected:
+            self.connect()
+
+        if self.backend == 'ownet':
+            return [address.split('.', 1)[-1] for address in self.client.devices('/alarm')]
+        return [sensor.id for sensor in ow.Sensor('/alarm').sensorList()]
+
+    def _scan(self):
+        '''
+        Scan bus and update device list, reconnecting once on failure.
+        '''
+        localLog = logging.getLogger(self.logPath + "._scan")
+        localLog.debug("Scanning 1-Wire bus...")
+
+        try:
+            self.deviceList = self._sensorList()
+        except Exception as e:
+            self.log.warning("Oops! Failed to scan 1-Wire bus! - " + str(e))
+            self.reconnect()
+            self.deviceList = self._sensorList()
+
+        self._scanTime = time.time()
+        self._rescanRequested = False
+        localLog.debug("Device list updated from owServer (" + str(len(self.deviceList)) + " devices).")
+
+    def _sensorList(self):
+        '''
+        List all devices on the bus.
+        '''
+        if self.backend != 'ownet':
+            return ow.Sensor('/').sensorList()
+
+        # Get type and family of all devices in one (pipelined) request
+        deviceIds = self.client.devices('/')
+        paths = []
+        for deviceId in deviceIds:
+            paths += ['/' + deviceId + '/type', '/' + deviceId + '/family']
+        values = self.client.readMany(paths)
+
+        sensorList = []
+        for i, deviceId in enumerate(deviceIds):
+            deviceType, deviceFamily = values[2*i:2*i + 2]
+            if isinstance(deviceType, Exception) or isinstance(deviceFamily, Exception):
+                self.log.warning("Oops! Failed to get properties of device! - " + str(deviceId))
+                continue
+            sensorList.append(owNetSensor(self.client, deviceId,
+                deviceType.strip(), deviceFamily.strip()))
+
+        return sensorList
+
+class owReadJob(object):
+    '''
+    Single device read submitted to an owReadPool.
+    '''
+
+    def __init__(self, func, args):
+        '''
+        Initialize class
+        '''
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.submitTime = time.time()
+        self.startTime = 0          # Epoch (0 = not started)
+        self.isCancelled = False
+        self._done = Event()
+
+    def cancel(self):
+        '''
+        Cancel job. A job not yet started is skipped, the result of a running
+        job is discarded.
+        '''
+        self.isCancelled = True
+
+    @property
+    def isRunning(self):
+        return self.startTime != 0 and not self._done.is_set()
+
+    def wait(self, timeout):
+        '''
+        Wait for job to finish, at most timeout seconds after it was started
+        (or submitted, if not started), regardless of when waiting begins.
+        Unfinished jobs are cancelled.
+
+        Returns True if the job finished in time.
+        '''
+        while True:
+            deadline = (self.startTime or self.submitTime) + timeout
+            if self._done.wait(max(deadline - time.time(), 0)):
+                return not self.isCancelled
+
+            # Started since deadline was taken? - wait for started job
+            if self.startTime and self.startTime + timeout > deadline:
+                continue
+            self.cancel()
+            return False
+
+class owReadPool(object):
+    '''
+    Bounded pool of worker threads reading 1-Wire devices concurrently.
+    '''
+
+    def __init__(self, size, onExit=None):
+        '''
+        Initialize class. onExit is called by each worker thread before it
+        exits, e.g. to close its connection.
+        '''
+        # Logging
+        self.logPath = "root.OWD.readPool"
+        self.log = logging.getLogger(self.logPath)
+
+        # Instance variables
+        self.size = size
+        self.onExit = onExit
+        self._queue = Queue.Queue()
+        self._lock = Lock()
+        self._workers = 0
+        self._workerCount = 0
+
+    def _spawn(self):
+        '''
+        Start a new worker thread (call with lock held).
+        '''
+        self._workers += 1
+        self._workerCount += 1
+        thr = Thread(target=self._worker, name="owReadPool-" + str(self._workerCount))
+        thr.daemon = True
+        thr.start()
+
+    def _worker(self):
+        '''
+        Worker loop, executing jobs from the queue.
+        '''
+        try:
+            while True:
+                job = self._queue.get()
+
+                # Stop worker
+                if job is None:
+                    return
+
+                # Run job (unless cancelled while queued)
+                if not job.isCancelled:
+                    job.startTime = time.time()
+                    try:
+                        job.result = job.func(*job.args)
+                    except Exception as e:
+                        job.error = e
+                    job._done.set()
+
+                # Retire worker if pool is oversized (replaced while stuck or resized)
+                with self._lock:
+                    if self._workers > self.size:
+                        self._workers -= 1
+                        return
+        finally:
+            if self.onExit is not None:
+                try:
+                    self.onExit()
+                except Exception as e:
+                    self.log.warning("Oops! Failed to clean up read worker! - " + str(e))
+
+    def submit(self, func, *args):
+        '''
+        Submit func(*args) to the pool. Returns an owReadJob.
+        '''
+        job = owReadJob(func, args)
+        with self._lock:
+            if self._workers < self.size:
+                self._spawn()
+        self._queue.put(job)
+        return job
+
+    def abandon(self, job):
+        '''
+        Give up on a (timed out) job. A job still running blocks its worker, so
+        a replacement worker is started to keep the pool at size.
+        '''
+        job.cancel()
+        if job.isRunning:
+            self.log.debug("Replacing worker blocked by timed out read...")
+            with self._lock:
+                self._spawn()
+
+    def close(self):
+        '''
+        Stop all idle workers.
+        '''
+        with self._lock:
+            self.size = 0
+            workers = self._workers
+        for i in range(workers):
+            self._queue.put(None)
+
+class adaptiveSampler(object):
+    '''
+    Adaptive per-device polling. The polling interval of a device is doubled
+    while its readings stay within the deadband, and shortened when readings
+    change faster, within the minimum and maximum polling intervals.
+    '''
+
+    def __init__(self, deadband=0.1, minInterval=1, maxInterval=60):
+        '''
+        Initialize class
+        '''
+        self.deadband = deadband
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self._devices = {}          # deviceId -> [interval, nextDue, lastTime, lastData]
+
+    def isDue(self, deviceId, t):
+        '''
+        Check if device is due for reading at time t (epoch).
+        '''
+        state = self._devices.get(deviceId)
+        return state is None or t >= state[1]
+
+    def update(self, deviceId, data, t):
+        '''
+        Update polling interval of device from new reading (data) at time t.
+        '''
+        state = self._devices.get(deviceId)
+        if state is None:
+            self._devices[deviceId] = [self.minInterval, t + self.minInterval, t, dict(data)]
+            return
+
+        interval, nextDue, lastTime, lastData = state
+
+        # Largest change of any (numeric) sensor since last reading
+        change = 0
+        for sensor in data:
+            if sensor in lastData and isinstance(data[sensor], (int, long, float)):
+                change = max(change, abs(data[sensor] - lastData[sensor]))
+
+        if change <= self.deadband:
+            # Stable - back off
+            interval *= 2
+        else:
+            # Changing - aim for one deadband of change per interval
+            rate = change / max(t - lastTime, 1e-3)
+            interval = min(interval / 2.0, self.deadband / rate)
+        interval = min(max(interval, self.minInterval), self.maxInterval)
+
+        self._devices[deviceId] = [interval, t + interval, t, dict(data)]
+
+    def prune(self, deviceIds):
+        '''
+        Forget devices not in deviceIds (removed from bus).
+        '''
+        deviceIds = set(deviceIds)
+        for deviceId in self._devices.keys():
+            if deviceId not in deviceIds:
+                del self._devices[deviceId]
+
 class owDevices(object):
     '''
     Class representing all devices on the 1-1wire.
@@ -47,9 +626,9 @@ class owDevices(object):
 
 
     # def __init__(self, settings):
-    def __init__(self):
+    def __init__(self, config=None):
         '''
-        Initialize class
+        Initialize class. Local configuration is read from file unless given.
         '''
         # Logging
         self.logPath = "root.OWD"
@@ -63,97 +642,206 @@ class owDevices(object):
         # Device readings
         self.deviceReading = {}
 
+        # Get Local Configuration Parameters
+        if config is None:
+            localLog.debug("Getting configuration parameters from file...")
+            config = getLocalConfig()
+
+        # Locally relevant parameters
+        owServer = getConfigOption(config, "owserver", "server", "localhost:4304")
+        owBackend = getConfigOption(config, "owserver", "backend")
+        owTimeout = float(getConfigOption(config, "owserver", "timeout", 5.0))
+        localLog.debug("Parameter: (owServer) " + owServer)
+        localLog.debug("Parameter: (owBackend) " + str(owBackend))
+
+        # owServer session (kept open between readings)
+        self.session = owServerSession(owServer, owBackend, owTimeout)
+
+        # Sensor drivers from configuration
+        loadDrivers(config)
+        self._unknownTypes = set()
+
+        # Concurrent read pool (created on demand)
+        self._readPool = None
+
+        # Adaptive per-device polling
+        self._sampler = adaptiveSampler()
+
+        # Alarm search
+        self._alarmThresholds = {}      # deviceId -> (low, high) programmed
+        self._alarmSweepTime = 0        # Epoch of last full sweep
+        self._alarmVerify = False       # Read back thresholds (full sweep)
+
         # Time series measurements
         # ========================
-        self._timeBucket            = {}            # Dict
+        self._timeBucket            = {}            # Dict of dict of bucketStats
         self._timeBucketTime        = 0             # Epoch
         self._timeBucketTypeDefault = 's'           # Char
-        self._timeBucketEmptyTime   = time.time()   # Epoch
         self._timeBucketTypeLibrary = {
+            'd' : 'day',
             'h' : 'hour',
             'm' : 'minute',
             's' : 'second'
         }
+        self._retention             = timeseriesRetention()
+        self._bucket                = bucketBoundary()
+        self._rollupTiers           = []            # List of rollupTier
+        self._rollupTiersSpec       = ''
+        self._compressor            = timeseriesCompressor()
+
+        # Reconfigure (next reading) when settings change
+        self._reconfigure = True
+        greger.options.subscribe(_reconfigureSettings, self._settingsChanged)
+
         # Output variable
         self.timeseries = {}
+        self.rollups = {}
+        self.metrics = {
+            'timeseriesPoints': 0,
+            'timeseriesBytes': 0,
+            'timeseriesEvicted': 0,
+            'rollupPoints': 0,
+            'busTimeEstimate': 0,
+            'devicesRead': 0,
+            'devicesSkipped': 0,
+            'alarmDevices': 0,
+            'compressionRatio': 1.0,
+            'compressionBytesSaved': 0,
+            'compressionWritesSaved': 0
+            }
 
         # Start message
         self.log.info("1-Wire Devices (OWD) successfully initiated!")
 
-    def _initOW(self):
+    def close(self):
         '''
-        Initiate 1-Wire server (owServer).
+        Close owServer session and stop read pool.
         '''
-        # Logger
-        localLog = logging.getLogger(self.logPath + "._initOW")
-        localLog.debug("Initiating owServer...")
-
-        # Init owServer at localhost
-        ow.init('localhost:4304')
-        ow.Sensor('/').useCache(False)
-        localLog.debug("owServer initiated successfully!")
+        greger.options.unsubscribe(self._settingsChanged)
+        if self._readPool is not None:
+            self._readPool.close()
+            self._readPool = None
+        self.session.close()
 
-        self.deviceList = ow.Sensor('/').sensorList()
-        localLog.debug("Device list updated from owServer.")
-
-    def _flushOW(self):
+    def _readDevice(self, owDevice, ndigits, latched=False):
         '''
-        Flush and stop connection to owServer
+        Read all sensors of a single device. Returns (sensorData, time).
+        Latched readings use the values of the last simultaneous conversion.
         '''
-        # Logger
-        localLog = logging.getLogger(self.logPath + "._flushOW")
-        localLog.debug("Stoping owServer...")
+        # Disable cache
+        owDevice.useCache(False)
 
-        ow.finish()
+        # Get device and sensor data from OW
+        sensorData = self.getSensor(owDevice, ndigits=ndigits, latched=latched)
+        return (sensorData, time.time())
 
-    def _timeToEmptyBucket(self):
+    def _readSequential(self, deviceList, ndigits, latched=False):
         '''
-        Calculate if it is time to empty the Timeseries Bucket.
+        Read devices one by one. Returns list of (owDevice, (sensorData, time)),
+        with None in place of the reading for failed devices.
         '''
-        localLog = logging.getLogger(self.logPath + "._timeToEmptyBucket")
-
-        # Get local settings
-        bucketType = greger.settings['owdTimeseriesBucketType']['value']
-        bucketSize = greger.settings['owdTimeseriesBucketSize']['value']
+        # Read all devices in one batch if supported by backend
+        if self.session.backend == 'ownet':
+            return self._readBatch(deviceList, ndigits, latched)
 
-        # Initialize local variable
-        answer = False
-        dDay    = time.localtime().tm_wday - time.localtime(self._timeBucketTime).tm_wday
-        dHour   = time.localtime().tm_hour - time.localtime(self._timeBucketTime).tm_hour
-        dMin    = time.localtime().tm_min - time.localtime(self._timeBucketTime).tm_min
-        dSec    = time.localtime().tm_sec - time.localtime(self._timeBucketTime).tm_sec
-
-        # Evaluate if enough time has passed to empty the bucket
-        localLog.debug("Evaluate if enough time has passed to empty the bucket")
-        if str(bucketType).lower() == 'h':
-            answer = abs(dDay) > 0 or dHour > int(bucketSize)
-
-        elif str(bucketType).lower() == 'm':
-            answer = abs(dDay) > 0 or abs(dHour) > 0 or dMin > int(bucketSize)
+        readings = []
+        for owDevice in deviceList:
+            try:
+                readings.append((owDevice, self._readDevice(owDevice, ndigits, latched)))
+            except Exception as e:
+                self.log.warning("Oops! Failed to read device! - " + str(e))
+                readings.append((owDevice, None))
 
-        elif str(bucketType).lower() == 's':
-            answer = abs(dDay) > 0 or abs(dHour) > 0 or abs(dMin) > 0 or dSec > int(bucketSize)
+        return readings
 
-        else:
-            self.log.error("Timeseries Bucket type could not be determined! - " +
-                str(bucketType))
+    def _readBatch(self, deviceList, ndigits, latched=False):
+        '''
+        Read all attributes of all devices in one pipelined request. Returns
+        list of (owDevice, (sensorData, time)), with None in place of the
+        reading for failed devices.
+        '''
+        # Get attribute paths of all devices
+        devicePaths = []
+        allPaths = []
+        for owDevice in deviceList:
+            owDevice.useCache(False)
+            driver = self._getDriver(owDevice)
+            paths = driver.paths(latched) if driver is not None else []
+            devicePaths.append((owDevice, driver, len(paths)))
+            allPaths += [owDevice.path + '/' + path for path in paths]
+
+        # Read all paths
+        startTime = time.time()
+        try:
+            values = self.session.client.readMany(allPaths)
+        except Exception as e:
+            self.log.warning("Oops! Failed to read devices! - " + str(e))
+            return [(owDevice, None) for owDevice in deviceList]
+        t = time.time()
+        pathTime = (t - startTime) / max(len(allPaths), 1)
+
+        # Convert values of each device
+        readings = []
+        i = 0
+        for owDevice, driver, count in devicePaths:
+            deviceValues = values[i:i + count]
+            i += count
+            if driver is None:
+                readings.append((owDevice, ({}, t)))
+                continue
 
-        # Reset timeBucket empty time if first reading ever
-        if self._timeBucketEmptyTime == 0:
-            self._timeBucketEmptyTime = time.time()
+            errors = [value for value in deviceValues if isinstance(value, Exception)]
+            try:
+                if errors:
+                    raise errors[0]
+                driver.updateCost(pathTime * count)
+                readings.append((owDevice, (driver.convert(deviceValues, ndigits), t)))
+            except Exception as e:
+                self.log.warning("Oops! Failed to read device! - " + str(e))
+                readings.append((owDevice, None))
 
-        # Print result to consol
-        self.log.info(
-            "Time to empty bucket: " + str(answer).upper() +
-            " (empty@" + time.strftime("%H:%M:%S",time.localtime(self._timeBucketEmptyTime)) +
-            " (+" + str(bucketSize) + str(bucketType) + ")" +
-            " dDay=" + str(dDay) +
-            " dHour=" + str(dHour) +
-            " dMin=" + str(dMin) +
-            " dSec=" + str(dSec) + ")"
-            )
+        return readings
 
-        return answer
+    def _readConcurrent(self, deviceList, ndigits, readThreads, readTimeout, latched=False):
+        '''
+        Read devices concurrently using a bounded thread pool, with a timeout
+        per device. Returns list of (owDevice, (sensorData, time)), with None
+        in place of the reading for failed or timed out devices.
+        '''
+        localLog = logging.getLogger(self.logPath + "._readConcurrent")
+
+        # (Re-)create pool if size changed
+        if self._readPool is None or self._readPool.size != readThreads:
+            if self._readPool is not None:
+                self._readPool.close()
+            localLog.debug("Creating read pool with " + str(readThreads) + " threads...")
+            self._readPool = owReadPool(readThreads, self.session.release)
+
+        # Submit all reads, then collect results in device order
+        jobs = [(owDevice, self._readPool.submit(self._readDevice, owDevice, ndigits, latched))
+            for owDevice in deviceList]
+
+        readings = []
+        for owDevice, job in jobs:
+            if not job.wait(readTimeout):
+                self.log.warning("Oops! Device read timed out! - " + str(owDevice.id) +
+                    " (" + str(readTimeout) + "s)")
+                self._readPool.abandon(job)
+                readings.append((owDevice, None))
+            elif job.error is not None:
+                self.log.warning("Oops! Failed to read device! - " + str(job.error))
+                readings.append((owDevice, None))
+            else:
+                readings.append((owDevice, job.result))
+
+        return readings
+
+    def _timeToEmptyBucket(self, t):
+        '''
+        Calculate if it is time to empty the Timeseries Bucket, i.e. if time t
+        (epoch) is past the end of the bucket.
+        '''
+        return t >= self._bucket.end
 
     def _emptyBucket(self):
         '''
@@ -161,11 +849,18 @@ class owDevices(object):
         '''
         localLog = logging.getLogger(self.logPath + "._emptyBucket")
 
-        # Get settings from server
-        sensorResolution = greger.settings['owdSensorResolution']['value']
+        # Get settings
+        settings = greger.options
+        sensorResolution = settings.owdSensorResolution
 
         # Empty each device in bucket to timeseries
         for deviceId in self._timeBucket:
+            # Fold bucket into coarser rollup tiers
+            for sensor in self._timeBucket[deviceId]:
+                for tier in self._rollupTiers:
+                    tier.fold(deviceId, sensor, self._timeBucket[deviceId][sensor],
+                        self._timeBucketTime, sensorResolution)
+
             # Get console message
             infoMsg = "Emptying:"
             infoMsg += " " + str(deviceId) + " - "
@@ -177,12 +872,11 @@ class owDevices(object):
             # Get device values
             firstSensor = True
             for sensor in self._timeBucket[deviceId]:
-                # Calculate sensor valuse
-                sensorValues = self._timeBucket[deviceId][sensor].values()
-                sensorMax = max(sensorValues)
-                sensorMin = min(sensorValues)
-                sensorMean = float(sum(sensorValues)) / max(len(sensorValues), 1)
-                sensorMean = round(sensorMean, int(sensorResolution))
+                # Get sensor values
+                newValues = self._timeBucket[deviceId][sensor].point(sensorResolution)
+                sensorMax = newValues['max']
+                sensorMin = newValues['min']
+                sensorMean = newValues['mean']
 
                 # Update consol message
                 if not firstSensor:
@@ -194,97 +888,136 @@ class owDevices(object):
                 infoMsg += str(sensorMean) + " "
                 infoMsg += str(sensorMax) + "]"
 
-                # Average sensor times
-                newValues = { str(int(self._timeBucketTime)) : {
-                    'max': sensorMax,
-                    'min' : sensorMin,
-                    'mean' : sensorMean
-                    }}
-
-                # Ensure sensor is in timeseries
-                if sensor not in self.timeseries[deviceId]:
-                    self.timeseries[deviceId].update({sensor:{}})
-
-                # Update timeseries
-                self.timeseries[deviceId][sensor].update(newValues)
+                # Update timeseries with points kept by compression
+                for keptTime, keptValues in self._compressor.offer(deviceId, sensor,
+                        self._timeBucketTime, newValues):
+                    self._addPoint(deviceId, sensor, keptTime, keptValues)
 
             # Print complete consol message
             self.log.info(infoMsg)
 
+        # Evict old timeseries points
+        evicted = self._retention.evict(self.timeseries,
+            settings.owdTimeseriesMaxAge, settings.owdTimeseriesMaxPoints, time.time())
+        self.metrics.update({
+            'timeseriesPoints': self._retention.points,
+            'timeseriesBytes': self._retention.footprint(self.timeseries),
+            'timeseriesEvicted': self._retention.evicted,
+            'rollupPoints': sum(tier.retention.points for tier in self._rollupTiers),
+            'compressionRatio': round(self._compressor.ratio, 2),
+            'compressionBytesSaved': self._compressor.bytesIn - self._compressor.bytesOut,
+            'compressionWritesSaved': self._compressor.pointsIn - self._compressor.pointsOut
+            })
+        self.log.info("Timeseries: " + str(self.metrics['timeseriesPoints']) + " points" +
+            " (~" + str(self.metrics['timeseriesBytes'] / 1024) + " kB)" +
+            ", " + str(evicted) + " evicted")
+
         # Reset timeBucket and bucket empty time
         self._timeBucket = {}
-        self._timeBucketEmptyTime = time.time()
 
-    def _setBucketTime(self):
+    def _addPoint(self, deviceId, sensor, t, point):
         '''
-        Set timeseries bucket time.
+        Add point at time t (bucket start epoch) to timeseries.
+        '''
+        newKey = str(int(t))
+        series = self.timeseries.setdefault(deviceId, {}).setdefault(sensor, {})
+        if newKey not in series:
+            self._retention.add(deviceId, sensor, newKey, point)
+        series[newKey] = point
+
+    def _setBucketTime(self, t):
+        '''
+        Set timeseries bucket time to the bucket containing time t (epoch).
         '''
         localLog = logging.getLogger(self.logPath + "._setBucketTime")
 
         # Get settings
-        bucketType = greger.settings['owdTimeseriesBucketType']['value']
-        bucketSize = greger.settings['owdTimeseriesBucketSize']['value']
-
-        # Get current time as a list
-        timeStruct = [
-            time.localtime().tm_year,      # 0 : (for example, 1993)
-            time.localtime().tm_mon,       # 1 : range [1, 12]
-            time.localtime().tm_mday,      # 2 : range [1, 31]
-            time.localtime().tm_hour,      # 3 : range [0, 23]
-            time.localtime().tm_min,       # 4 : range [0, 59]
-            time.localtime().tm_sec,       # 5 : range [0, 61]
-            time.localtime().tm_wday,      # 6 : range [0, 6], Monday is 0
-            time.localtime().tm_yday,      # 7 : range [1, 366]
-            time.localtime().tm_isdst      # 8 : 0, 1 or -1; -1 == unknown
-            ]
-
-        # Reset timeStruct to match timeBucket
-        bucketSizeOutOfBounds = False
-        if str(bucketType).lower() == 'h':
-            # Is bucket size within bounds
-            if int(bucketSize) > 23:
-                bucketSize = 23
-                bucketSizeOutOfBounds = True
-
-            # Set hour to start of timeBucket and min/sec to zero
-            timeStruct[3] -= timeStruct[3] % bucketSize
-            timeStruct[4] = 0
-            timeStruct[5] = 0
-
-        elif str(bucketType).lower() == 'm':
-            # Is bucket size within bounds
-            if int(bucketSize) > 59:
-                bucketSize = 59
-                bucketSizeOutOfBounds = True
-
-            # Set minutes to start of timeBucket and sec to zero
-            timeStruct[4] -= timeStruct[4] % int(bucketSize)
-            timeStruct[5] = 0
-
-        elif str(bucketType).lower() == 's':
-            # Is bucket size within bounds
-            if int(bucketSize) > 61:
-                bucketSize = 61
-                bucketSizeOutOfBounds = True
-
-            # Set sec to start of timeBucket
-            timeStruct[5] -= timeStruct[5] % int(bucketSize)
+        bucketType = greger.options.owdTimeseriesBucketType
+        bucketSize = greger.options.owdTimeseriesBucketSize
 
-        else:
+        # Get bucket width (s)
+        try:
+            self._bucket.width = bucketWidth(bucketType, bucketSize)
+        except (KeyError, ValueError):
             self.log.error("Timeseries Bucket type could not be determined! - " +
-                str(bucketType))
-            # self._disableTimeseries()
-
-        # Get consol message
-        if bucketSizeOutOfBounds:
-            self.log.warning(
-                "Bucket size out of bounds! - reset to: " +
-                int(bucketSize) +
-                self._timeBucketTypeLibrary[bucketType])
-        else:
-            # Update time bucket time
-            self._timeBucketTime = time.mktime(tuple(timeStruct))
-            self.log.info("Bucket time set to: " + time.strftime('%H:%M:%S',time.localtime(self._timeBucketTime)))
+                str(bucketSize) + str(bucketType) + " (using " +
+                self._timeBucketTypeLibrary[self._timeBucketTypeDefault] + ")")
+            self._bucket.width = bucketWidth(self._timeBucketTypeDefault, 1)
+
+        # Update time bucket time
+        self._bucket.set(t)
+        self._timeBucketTime = self._bucket.start
+        self.log.info("Bucket time set to: " +
+            time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(self._bucket.start)) + " - " +
+            time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(self._bucket.end)))
+
+        # Flush finished rollup tier buckets
+        sensorResolution = greger.options.owdSensorResolution
+        for tier in self._rollupTiers:
+            tier.advance(self._bucket.start, sensorResolution)
+
+    def _settingsChanged(self, keys):
+        '''
+        Settings subscription callback (GDB thread) - reconfigure next reading.
+        '''
+        self._reconfigure = True
+
+    def _configure(self):
+        '''
+        Configure compression, adaptive sampling and rollup tiers from settings.
+        '''
+        localLog = logging.getLogger(self.logPath + "._configure")
+        settings = greger.options
+
+        # Set lossy compression mode (keeping points held by old mode)
+        try:
+            for deviceId, sensor, keptTime, keptPoint in self._compressor.configure(
+                    settings.owdCompression, settings.owdCompressionTolerance,
+                    settings.owdCompressionMaxHold):
+                self._addPoint(deviceId, sensor, keptTime, keptPoint)
+        except ValueError as e:
+            localLog.warning("Oops! Failed to set timeseries compression - " + str(e))
+
+        # Set adaptive sampling parameters
+        self._sampler.deadband = settings.owdDeadband
+        self._sampler.minInterval = settings.owdMinPollInterval
+        self._sampler.maxInterval = settings.owdMaxPollInterval
+
+        # Set rollup tiers
+        self._setRollupTiers()
+
+    def _setRollupTiers(self):
+        '''
+        Update rollup tiers from settings.
+        '''
+        localLog = logging.getLogger(self.logPath + "._setRollupTiers")
+
+        # Get settings
+        tiersSpec = greger.options.owdRollupTiers
+        if tiersSpec == self._rollupTiersSpec:
+            return
+
+        try:
+            tiers = parseRollupTiers(tiersSpec)
+        except (KeyError, ValueError) as e:
+            self.log.error("Oops! Rollup tiers could not be determined! - " + str(e))
+            return
+        self._rollupTiersSpec = tiersSpec
+
+        # Keep existing tiers with unchanged width
+        oldTiers = dict((tier.name, tier) for tier in self._rollupTiers)
+        self._rollupTiers = []
+        for name, width, maxPoints in tiers:
+            tier = oldTiers.get(name)
+            if tier is None or tier.width != width:
+                tier = rollupTier(name, width)
+            tier.maxPoints = maxPoints
+            self._rollupTiers.append(tier)
+            localLog.debug("Rollup tier: " + name + " (" + str(width) + "s, " +
+                str(maxPoints) + " points)")
+
+        self.rollups = dict((tier.name, tier.timeseries) for tier in self._rollupTiers)
+        self.log.info("Rollup tiers set to: " + str(tiersSpec))
 
     def readAll(self):
         '''
@@ -293,9 +1026,21 @@ class owDevices(object):
         localLog = logging.getLogger(self.logPath + ".readAll")
 
         # Get local settings
-        enableTimeseries = greger.settings['owdEnableTimeseries']['value']
-        sensorResolution = greger.settings['owdSensorResolution']['value']
-        enableStrftime = greger.settings['owdEnableStrftime']['value']
+        settings = greger.options
+        enableTimeseries = settings.owdEnableTimeseries
+        sensorResolution = settings.owdSensorResolution
+        simultaneousConversion = settings.owdSimultaneousConversion
+        enableStrftime = settings.owdEnableStrftime
+        rescanInterval = settings.owdRescanInterval
+        readThreads = settings.owdReadThreads
+        readTimeout = settings.owdReadTimeout
+        adaptiveSampling = settings.owdAdaptiveSampling
+        alarmSearch = settings.owdAlarmSearch
+
+        # Apply changed settings
+        if self._reconfigure:
+            self._reconfigure = False
+            self._configure()
 
         # Init local variables
         warningMsg = ''
@@ -303,21 +1048,24 @@ class owDevices(object):
 
         # Initialize timeBucket
         localLog.debug("Reviewing Time Bucket..")
-        if enableTimeseries:
-            # Set timeBucket time if timeBucket is empty
-            if not self._timeBucket:
-                localLog.debug("Time Bucket is empty, setting new time.")
-                self._setBucketTime()
-
+        t = time.time()
+        if enableTimeseries and self._timeToEmptyBucket(t):
             # Empty timeBucket
-            if self._timeBucket and self._timeToEmptyBucket():
+            if self._timeBucket:
                 localLog.debug("Time to empty bucket!")
                 self._emptyBucket()
-                self._setBucketTime()
 
-        # Update 1-Wire server
-        localLog.debug("Updating 1-Wire server (initOW).")
-        self._initOW()
+            # Set new timeBucket time
+            self._setBucketTime(t)
+
+        # Get (cached) device list from 1-Wire server
+        localLog.debug("Getting device list from owServer session...")
+        try:
+            deviceList = self.session.devices(rescanInterval=rescanInterval)
+        except Exception as e:
+            self.log.warning("Oops! Failed to get device list from owServer! - " + str(e))
+            self.session.invalidate(reconnect=True)
+            deviceList = []
 
         # Init local copy of old device reading
         oldDeviceReading = self.deviceReading.copy()
@@ -329,18 +1077,64 @@ class owDevices(object):
         # Init local new reading
         newDeviceReading = oldDeviceReading.copy()
 
+        # Select devices due for reading (alarm search / adaptive sampling)
+        latched = False
+        if alarmSearch:
+            # Alarm flags are set by conversion - convert before search
+            if deviceList:
+                latched = self._convertAll()
+            dueList = self._alarmList(deviceList, t, settings.owdAlarmSweepInterval)
+            dueIds = set(owDevice.id for owDevice in dueList)
+            for owDevice in deviceList:
+                if owDevice.id not in dueIds and owDevice.id in newDeviceReading:
+                    # Not in alarm - keep last reading
+                    newDeviceReading[owDevice.id]['isActive'] = True
+        elif adaptiveSampling:
+            self._sampler.prune([owDevice.id for owDevice in deviceList])
+
+            dueList = []
+            for owDevice in deviceList:
+                if self._sampler.isDue(owDevice.id, t):
+                    dueList.append(owDevice)
+                elif owDevice.id in newDeviceReading:
+                    # Not due - keep last reading
+                    newDeviceReading[owDevice.id]['isActive'] = True
+            localLog.debug(str(len(dueList)) + " of " + str(len(deviceList)) + " devices due for reading.")
+        else:
+            dueList = deviceList
+        self.metrics['devicesRead'] = len(dueList)
+        self.metrics['devicesSkipped'] = len(deviceList) - len(dueList)
+
+        # Estimated bus time of reading
+        self.metrics['busTimeEstimate'] = self.busTime(dueList)
+
+        # Convert all temperatures at once (batch sampling)
+        if simultaneousConversion and dueList and not alarmSearch:
+            latched = self._convertAll()
+
         # Read all devices
-        for owDevice in self.deviceList:
-            try:
-                # Disable cache
-                owDevice.useCache(False)
+        if readThreads > 1:
+            sensorReadings = self._readConcurrent(dueList, sensorResolution,
+                readThreads, readTimeout, latched)
+        else:
+            sensorReadings = self._readSequential(dueList, sensorResolution,
+                latched)
+        failedReads = 0
+
+        # Update device readings
+        for owDevice, sensorReading in sensorReadings:
+            if sensorReading is None:
+                failedReads += 1
+                continue
 
-                # Get device and sensor data from OW
-                newSensorData = self.getSensor(owDevice, ndigits=int(sensorResolution))
+            try:
+                # Get device and sensor data and time of reading
+                newSensorData, t = sensorReading
+                sft = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
 
-                # Get time
-                t = time.time()
-                sft = time.strftime('%Y-%m-%d %H:%M:%S')
+                # Update polling interval
+                if adaptiveSampling:
+                    self._sampler.update(owDevice.id, newSensorData, t)
 
                 # Update consol message
                 infoMsg = "Device (" + str(owDevice.type) + "): "
@@ -376,9 +1170,8 @@ class owDevices(object):
                     for sensor in newSensorData:
                         if enableTimeseries:
                             # Add to timeBucket (timeseries)
-                            self._timeBucket[owDevice.id].update({sensor : {
-                                    str(t): newSensorData[sensor]
-                                    }})
+                            self._timeBucket[owDevice.id][sensor] = bucketStats()
+                            self._timeBucket[owDevice.id][sensor].add(newSensorData[sensor])
 
                         # Update consol message
                         if not firstSensor:
@@ -405,19 +1198,17 @@ class owDevices(object):
 
                     # Check all device sensors for new values
                     for sensor in newSensorData:
-                        # New value available?
-                        if newSensorData[sensor] != oldSensorData[sensor]:
-                            if enableTimeseries:
-                                # Update timeBucket (timeseries)
-                                if owDevice.id not in self._timeBucket:
-                                    self._timeBucket.update({owDevice.id:{}})
-                                if sensor not in self._timeBucket[owDevice.id]:
-                                    self._timeBucket[owDevice.id].update({sensor:{}})
+                        if enableTimeseries:
+                            # Update timeBucket (timeseries) with every reading
+                            if owDevice.id not in self._timeBucket:
+                                self._timeBucket.update({owDevice.id:{}})
+                            if sensor not in self._timeBucket[owDevice.id]:
+                                self._timeBucket[owDevice.id][sensor] = bucketStats()
 
-                                self._timeBucket[owDevice.id][sensor].update({
-                                        str(t): newSensorData[sensor]
-                                        })
+                            self._timeBucket[owDevice.id][sensor].add(newSensorData[sensor])
 
+                        # New value available?
+                        if newSensorData[sensor] != oldSensorData[sensor]:
                             # Update sensor reading time
                             newDeviceReading[owDevice.id].update({
                                 'lastModified': t})
@@ -442,7 +1233,8 @@ class owDevices(object):
                     oldSensorData.clear()
 
             except Exception as e:
-                self.log.warning("Oops! Failed to read device! - " + str(e))
+                self.log.warning("Oops! Failed to update device reading! - " + str(e))
+                failedReads += 1
                 continue
 
             # Print to console
@@ -458,15 +1250,126 @@ class owDevices(object):
         # Update self
         self.deviceReading = newDeviceReading.copy()
 
-        # Flush OW server
-        self._flushOW()
+        # Re-program alarm thresholds around new readings
+        if alarmSearch:
+            self._setAlarms([owDevice for owDevice, sensorReading in sensorReadings
+                if sensorReading is not None], settings.owdAlarmBand)
+
+        # Re-scan bus next reading if any device failed, reconnect if all did
+        if failedReads:
+            self.session.invalidate(reconnect=(failedReads == len(dueList)))
 
         # Return new device readings
         return self.deviceReading
 
-    def getSensor(self, sensor, ndigits=1):
+    def _convertAll(self):
+        '''
+        Start simultaneous conversion. Returns True if successful.
+        '''
+        try:
+            self.session.convertAll()
+            return True
+        except Exception as e:
+            self.log.warning("Oops! Simultaneous conversion failed, reading devices one by one! - " + str(e))
+            return False
+
+    def _alarmList(self, deviceList, t, sweepInterval):
+        '''
+        Devices to read in alarm search mode: devices in alarm state and
+        devices without programmed alarm thresholds, or all devices on a
+        full sweep every sweepInterval seconds (thresholds then read back
+        and verified on next _setAlarms).
+        '''
+        localLog = logging.getLogger(self.logPath + "._alarmList")
+
+        # Full (safety) sweep, verifying all alarm thresholds
+        if t - self._alarmSweepTime >= sweepInterval:
+            localLog.debug("Full sweep of " + str(len(deviceList)) + " devices.")
+            self._alarmSweepTime = t
+            self._alarmVerify = True
+            deviceIds = set(owDevice.id for owDevice in deviceList)
+            self._alarmThresholds = dict((deviceId, thresholds) for deviceId, thresholds
+                in self._alarmThresholds.items() if deviceId in deviceIds)
+            self.metrics['alarmDevices'] = 0
+            return deviceList
+
+        try:
+            alarmIds = set(self.session.alarmDevices())
+        except Exception as e:
+            self.log.warning("Oops! Failed to search devices in alarm state! (reading all) - " + str(e))
+            return deviceList
+        self.metrics['alarmDevices'] = len(alarmIds)
+
+        dueList = []
+        for owDevice in deviceList:
+            if owDevice.id in alarmIds or owDevice.id not in self._alarmThresholds:
+                dueList.append(owDevice)
+        localLog.debug(str(len(alarmIds)) + " devices in alarm state, reading " +
+            str(len(dueList)) + " of " + str(len(deviceList)) + " devices.")
+        return dueList
+
+    def _setAlarms(self, deviceList, band):
+        '''
+        Program alarm thresholds of devices to last reading +/- band.
+
+        Thresholds are only written when they differ from the ones set (kept
+        from last write, or read back from devices after a full sweep), as
+        devices may store them in EEPROM of limited write endurance.
+        '''
+        localLog = logging.getLogger(self.logPath + "._setAlarms")
+        verify, self._alarmVerify = self._alarmVerify, False
+        for owDevice in deviceList:
+            driver = self._getDriver(owDevice)
+            if driver is None or driver.alarm is None:
+                continue
+            value = self.deviceReading.get(owDevice.id, {}).get(driver.alarm[0])
+            if value is None:
+                continue
+
+            if verify:
+                try:
+                    self._alarmThresholds[owDevice.id] = driver.getAlarm(owDevice)
+                except Exception as e:
+                    self._alarmThresholds.pop(owDevice.id, None)
+                    localLog.debug("Failed to read alarm thresholds of " + str(owDevice.id) + "! - " + str(e))
+
+            thresholds = (int(math.floor(value - band)), int(math.ceil(value + band)))
+            if self._alarmThresholds.get(owDevice.id) == thresholds:
+                continue
+            try:
+                driver.setAlarm(owDevice, *thresholds)
+                self._alarmThresholds[owDevice.id] = thresholds
+                localLog.debug("Alarm thresholds of " + str(owDevice.id) + " set to " + str(thresholds) + ".")
+            except Exception as e:
+                self.log.warning("Oops! Failed to set alarm thresholds of " + str(owDevice.id) + "! - " + str(e))
+
+    def _getDriver(self, sensor):
+        '''
+        Get driver of 1-wire device, logging unknown device types once.
+        '''
+        driver = getDriver(sensor.type)
+        if driver is None and sensor.type not in self._unknownTypes:
+            self._unknownTypes.add(sensor.type)
+            self.log.warning("No driver for device type " + str(sensor.type) +
+                "! (reading no sensor values)")
+        return driver
+
+    def busTime(self, deviceList):
+        '''
+        Estimated bus time (s) to read all devices, from driver read costs.
+        '''
+        busTime = 0
+        for owDevice in deviceList:
+            driver = getDriver(owDevice.type)
+            if driver is not None:
+                busTime += driver.cost
+        return busTime
+
+    def getSensor(self, sensor, ndigits=1, latched=False):
         '''
         Get 1-wire device sensor output.
         '''
-        func = _sensorLib.get(sensor.type.lower(), "No sensor values found!")
-        return func(sensor, ndigits)
+        driver = self._getDriver(sensor)
+        if driver is None:
+            return {}
+        return driver.read(sensor, ndigits, latched)
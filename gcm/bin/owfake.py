@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+owfake - Local fake owServer speaking the owServer network protocol.
+
+Serves a set of virtual 1-Wire devices, for testing the Greger Client Module
+(GCM) without 1-Wire hardware or owfs installed.
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import time
+import random
+import socket
+import argparse
+import SocketServer
+from threading import Lock
+from threading import Thread
+
+# Local Modules
+from ownet import _header
+from ownet import MSG_NOP, MSG_READ, MSG_WRITE, MSG_DIR, MSG_PRESENCE, MSG_DIRALL
+from ownet import FLG_PERSISTENCE
+
+# owServer error codes (errno)
+_ENOENT = 2
+_EINVAL = 22
+
+class owFakeBus(object):
+    '''
+    Virtual 1-Wire bus: devices with attribute values (or functions returning
+    values).
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        self.devices = {}
+        self.lock = Lock()
+        self.simultaneousCount = 0
+
+    def addDevice(self, id, type, **attributes):
+        '''
+        Add device with id, type (e.g. 'DS18B20') and attribute values.
+        '''
+        device = {'type': type, 'family': id[:2], 'id': id[3:]}
+        device.update(attributes)
+        with self.lock:
+            self.devices[id] = device
+
+    def removeDevice(self, id):
+        '''
+        Remove (unplug) device.
+        '''
+        with self.lock:
+            self.devices.pop(id, None)
+
+    def _split(self, path):
+        '''
+        Split path into list of elements, ignoring /uncached.
+        '''
+        elements = [element for element in path.split('/') if element]
+        if elements and elements[0] == 'uncached':
+            elements = elements[1:]
+        return elements
+
+    def dir(self, path):
+        '''
+        List directory. Returns list of paths or None if not found.
+        '''
+        elements = self._split(path)
+        with self.lock:
+            if not elements:
+                return ['/' + id for id in sorted(self.devices)]
+            if elements == ['alarm']:
+                return ['/alarm/' + id for id in sorted(self.devices)
+                    if self._alarm(self.devices[id])]
+            if len(elements) == 1 and elements[0] in self.devices:
+                return ['/' + elements[0] + '/' + attribute
+                    for attribute in sorted(self.devices[elements[0]])]
+        return None
+
+    def _alarm(self, device):
+        '''
+        Check if device is in alarm state: 'alarm' attribute, or temperature
+        outside of thresholds 'templow' and 'temphigh'.
+        '''
+        if 'alarm' in device:
+            return device['alarm']() if callable(device['alarm']) else device['alarm']
+        if 'temphigh' not in device or 'templow' not in device:
+            return False
+        value = device.get('latesttemp', device.get('temperature'))
+        if callable(value):
+            value = value()
+        return not float(device['templow']) < float(value) < float(device['temphigh'])
+
+    def read(self, path):
+        '''
+        Read attribute. Returns string value or None if not found.
+        '''
+        elements = self._split(path)
+        with self.lock:
+            if len(elements) != 2 or elements[0] not in self.devices:
+                return None
+            value = self.devices[elements[0]].get(elements[1])
+        if value is None:
+            return None
+        if callable(value):
+            value = value()
+        if isinstance(value, float):
+            return '%12.4f' % value
+        return str(value)
+
+    def write(self, path, value):
+        '''
+        Write attribute. Returns True if successful.
+        '''
+        elements = self._split(path)
+        if elements == ['simultaneous', 'temperature']:
+            self.simultaneousCount += 1
+            return True
+        with self.lock:
+            if len(elements) != 2 or elements[0] not in self.devices:
+                return False
+            self.devices[elements[0]][elements[1]] = value
+        return True
+
+    def present(self, path):
+        '''
+        Check if device at path is present.
+        '''
+        elements = self._split(path)
+        with self.lock:
+            return not elements or elements[0] in self.devices
+
+class _owFakeHandler(SocketServer.BaseRequestHandler):
+    '''
+    Handle one client connection to the fake owServer.
+    '''
+
+    def _recv(self, nbytes):
+        data = ''
+        while len(data) < nbytes:
+            chunk = self.request.recv(nbytes - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _send(self, ret, flags, data='', size=None):
+        if size is None:
+            size = len(data)
+        self.request.sendall(_header.pack(0, len(data), ret, flags, size, 0) + data)
+
+    def handle(self):
+        # Send responses at once (pipelined requests)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._handle()
+        except socket.error:
+            # Client disconnected
+            pass
+
+    def _handle(self):
+        bus = self.server.bus
+        while True:
+            header = self._recv(_header.size)
+            if header is None:
+                return
+            version, payload, msgType, flags, size, offset = _header.unpack(header)
+            data = self._recv(payload) if payload > 0 else ''
+            if data is None:
+                return
+            path, sep, value = data.partition('\0')
+            value = value[:size] if msgType == MSG_WRITE else ''
+
+            # Simulated bus latency
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            persist = flags & FLG_PERSISTENCE
+            replyFlags = flags & FLG_PERSISTENCE
+
+            if msgType == MSG_READ:
+                result = bus.read(path)
+                if result is None:
+                    self._send(-_ENOENT, replyFlags)
+                else:
+                    self._send(len(result), replyFlags, result)
+
+            elif msgType == MSG_WRITE:
+                self._send(0 if bus.write(path, value) else -_ENOENT, replyFlags)
+
+            elif msgType == MSG_DIRALL:
+                entries = bus.dir(path)
+                if entries is None:
+                    self._send(-_ENOENT, replyFlags)
+                else:
+                    self._send(0, replyFlags, ','.join(entries))
+
+            elif msgType == MSG_DIR:
+                entries = bus.dir(path)
+                if entries is None:
+                    self._send(-_ENOENT, replyFlags)
+                else:
+                    for entry in entries:
+                        self._send(0, replyFlags, entry + '\0', len(entry))
+                    self._send(0, replyFlags)
+
+            elif msgType == MSG_PRESENCE:
+                self._send(0 if bus.present(path) else -_ENOENT, replyFlags)
+
+            elif msgType == MSG_NOP:
+                self._send(0, replyFlags)
+
+            else:
+                self._send(-_EINVAL, replyFlags)
+
+            if not persist:
+                return
+
+class owFakeServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    '''
+    Fake owServer serving an owFakeBus on a local TCP port.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, bus, host='localhost', port=0, latency=0):
+        '''
+        Initialize class. Port 0 selects a free port, see self.port.
+        '''
+        SocketServer.TCPServer.__init__(self, (host, port), _owFakeHandler)
+        self.bus = bus
+        self.latency = latency
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def address(self):
+        return self.server_address[0] + ':' + str(self.port)
+
+    def start(self):
+        '''
+        Serve in a background (daemon) thread.
+        '''
+        thr = Thread(target=self.serve_forever, name="owFakeServer")
+        thr.daemon = True
+        thr.start()
+        return thr
+
+    def stop(self):
+        '''
+        Stop serving and close server socket.
+        '''
+        self.shutdown()
+        self.server_close()
+
+def randomBus(ds18b20=10, ds2438=0):
+    '''
+    Create bus with a number of DS18B20 and DS2438 devices with noisy readings.
+    '''
+    bus = owFakeBus()
+    for i in range(ds18b20):
+        base = random.uniform(15, 25)
+        bus.addDevice('28.%012X' % (i + 1), 'DS18B20',
+            temperature=lambda base=base: base + random.gauss(0, 0.1),
+            latesttemp=lambda base=base: base + random.gauss(0, 0.1),
+            temphigh='75', templow='10')
+    # Serials follow the DS18B20 ones - device ids leave out the family code
+    for i in range(ds2438):
+        base = random.uniform(15, 25)
+        bus.addDevice('26.%012X' % (ds18b20 + i + 1), 'DS2438',
+            temperature=lambda base=base: base + random.gauss(0, 0.1),
+            humidity=lambda: random.uniform(40, 60))
+    return bus
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake owServer with virtual devices.')
+    parser.add_argument('-p', '--port', type=int, default=4304, help='TCP port (default 4304).')
+    parser.add_argument('--ds18b20', type=int, default=10, help='Number of DS18B20 devices.')
+    parser.add_argument('--ds2438', type=int, default=0, help='Number of DS2438 devices.')
+    parser.add_argument('--latency', type=float, default=0, help='Delay per request (s).')
+    args = parser.parse_args()
+
+    server = owFakeServer(randomBus(args.ds18b20, args.ds2438), port=args.port, latency=args.latency)
+    print "Fake owServer listening on " + server.address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
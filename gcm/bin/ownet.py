@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ownet - Client for the owServer network protocol.
+
+Pure Python replacement for the 'ow' C-extension module, with persistent
+connections, pipelined requests and explicit timeouts.
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import re
+import socket
+import struct
+import logging
+import threading
+
+# owServer message types
+MSG_ERROR = 0
+MSG_NOP = 1
+MSG_READ = 2
+MSG_WRITE = 3
+MSG_DIR = 4
+MSG_SIZE = 5
+MSG_PRESENCE = 6
+MSG_DIRALL = 7
+MSG_GET = 8
+
+# owServer control flags
+FLG_BUS_RET = 0x00000002
+FLG_PERSISTENCE = 0x00000004
+FLG_ALIAS = 0x00000008
+FLG_SAFEMODE = 0x00000010
+FLG_UNCACHED = 0x00000020
+FLG_OWNET = 0x00000100
+
+# Message header: version, payload, type/ret, flags, size, offset
+_header = struct.Struct('>iiiiii')
+
+# Maximum size of a single read
+_maxReadSize = 65536
+
+# Maximum number of requests in flight on one connection. Bounded, so that
+# neither side blocks on a full socket buffer while the other is writing.
+_pipelineDepth = 64
+
+# Device directory entries, e.g. '28.0123456789AB'
+_deviceId = re.compile(r'^[0-9A-F]{2}\.[0-9A-F]{12}$')
+
+class owNetError(Exception):
+    '''
+    Error returned by owServer, or communication failure.
+    '''
+
+    def __init__(self, message, errno=None):
+        Exception.__init__(self, message)
+        self.errno = errno
+
+class owNetClient(object):
+    '''
+    Client to owServer, keeping one persistent connection per thread.
+    '''
+
+    def __init__(self, host='localhost', port=4304, timeout=5.0, flags=FLG_OWNET):
+        '''
+        Initialize class
+        '''
+        # Logging
+        self.logPath = "root.OWD.ownet"
+        self.log = logging.getLogger(self.logPath)
+
+        # Instance variables
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.flags = flags | FLG_PERSISTENCE
+        self._local = threading.local()
+        self._sockets = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fromServer(cls, server, timeout=5.0):
+        '''
+        Create client from server string, e.g. 'localhost:4304'.
+        '''
+        host, sep, port = server.rpartition(':')
+        if not sep:
+            host, port = server, 4304
+        return cls(host, port, timeout)
+
+    @property
+    def _socket(self):
+        return getattr(self._local, 'socket', None)
+
+    def connect(self):
+        '''
+        Open connection to owServer (for calling thread).
+        '''
+        localLog = logging.getLogger(self.logPath + ".connect")
+        self.close()
+
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except socket.error as e:
+            raise owNetError("Failed to connect to owServer at " +
+                self.host + ":" + str(self.port) + " - " + str(e))
+        sock.settimeout(self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.socket = sock
+        with self._lock:
+            self._sockets.add(sock)
+        localLog.debug("Connected to owServer at " + self.host + ":" + str(self.port) + ".")
+
+    def close(self):
+        '''
+        Close connection to owServer (for calling thread).
+        '''
+        sock = self._socket
+        self._local.socket = None
+        if sock is not None:
+            self._closeSocket(sock)
+
+    def closeAll(self):
+        '''
+        Close connections to owServer of all threads.
+        '''
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            self._closeSocket(sock)
+        self._local = threading.local()
+
+    def _closeSocket(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+    def _request(self, msgType, path, value='', size=_maxReadSize):
+        '''
+        Pack request message.
+        '''
+        data = path + '\0' + value
+        if msgType == MSG_WRITE:
+            size = len(value)
+        return _header.pack(0, len(data), msgType, self.flags, size, 0) + data
+
+    def _recv(self, nbytes):
+        '''
+        Receive exactly nbytes from socket.
+        '''
+        chunks = []
+        while nbytes > 0:
+            chunk = self._socket.recv(nbytes)
+            if not chunk:
+                raise owNetError("Connection closed by owServer!")
+            chunks.append(chunk)
+            nbytes -= len(chunk)
+        return ''.join(chunks)
+
+    def _response(self):
+        '''
+        Receive one response message. Returns (ret, flags, data).
+        '''
+        while True:
+            version, payload, ret, flags, size, offset = _header.unpack(self._recv(_header.size))
+
+            # Keep-alive while owServer is busy
+            if payload == -1:
+                continue
+
+            data = self._recv(payload) if payload > 0 else ''
+            if 0 <= size <= len(data):
+                data = data[offset:offset + size] if 0 <= offset <= len(data) else data[:size]
+            return ret, flags, data
+
+    def _transact(self, requests):
+        '''
+        Send all requests at once (pipelined) and collect the responses, in
+        order. Reconnects and retries once if the connection was lost.
+
+        Returns list of (ret, data).
+        '''
+        for attempt in (1, 2):
+            if self._socket is None:
+                self.connect()
+
+            responses = []
+            try:
+                self._socket.sendall(''.join(requests))
+                for i in range(len(requests)):
+                    ret, flags, data = self._response()
+                    responses.append((ret, data))
+
+                    # Persistence not granted - owServer closes connection
+                    if not flags & FLG_PERSISTENCE:
+                        self.close()
+                        if i < len(requests) - 1:
+                            responses.extend(self._transact(requests[i + 1:]))
+                        break
+
+                return responses
+
+            except (socket.error, owNetError) as e:
+                self.close()
+                if attempt == 2 or responses:
+                    raise owNetError("Communication with owServer failed! - " + str(e))
+                self.log.debug("Connection to owServer lost, reconnecting... - " + str(e))
+
+    def _check(self, ret, path):
+        '''
+        Raise owNetError for error return codes.
+        '''
+        if ret < 0:
+            raise owNetError("owServer error " + str(-ret) + " on " + path, -ret)
+
+    def read(self, path):
+        '''
+        Read value at path.
+        '''
+        ret, data = self._transact([self._request(MSG_READ, path)])[0]
+        self._check(ret, path)
+        return data
+
+    def readMany(self, paths):
+        '''
+        Read values of all paths, pipelined over one connection. Failed reads
+        are returned as owNetError instances in place of the value.
+        '''
+        if not paths:
+            return []
+
+        requests = [self._request(MSG_READ, path) for path in paths]
+        responses = []
+        for i in range(0, len(requests), _pipelineDepth):
+            responses += self._transact(requests[i:i + _pipelineDepth])
+
+        values = []
+        for path, (ret, data) in zip(paths, responses):
+            if ret < 0:
+                values.append(owNetError("owServer error " + str(-ret) + " on " + path, -ret))
+            else:
+                values.append(data)
+        return values
+
+    def write(self, path, value):
+        '''
+        Write value to path.
+        '''
+        ret, data = self._transact([self._request(MSG_WRITE, path, str(value))])[0]
+        self._check(ret, path)
+
+    def dir(self, path='/'):
+        '''
+        List entries of directory at path.
+        '''
+        ret, data = self._transact([self._request(MSG_DIRALL, path)])[0]
+        self._check(ret, path)
+        return [entry for entry in data.rstrip('\0').split(',') if entry]
+
+    def devices(self, path='/'):
+        '''
+        List device ids found in directory at path.
+        '''
+        return [entry.rstrip('/').rsplit('/', 1)[-1] for entry in self.dir(path)
+            if _deviceId.match(entry.rstrip('/').rsplit('/', 1)[-1])]
+
+    def present(self, path):
+        '''
+        Check if path (device) is present.
+        '''
+        ret, data = self._transact([self._request(MSG_PRESENCE, path)])[0]
+        return ret >= 0
+
+class owNetSensor(object):
+    '''
+    Device on owServer, with the attribute interface of ow.Sensor.
+    '''
+
+    def __init__(self, client, address, type=None, family=None):
+        '''
+        Initialize class. Address is the device directory, e.g.
+        '28.0123456789AB', and id is the address without family code, as
+        for ow.Sensor.
+        '''
+        self.__dict__.update({
+            '_client': client,
+            '_prefix': '',
+            'address': address,
+            'id': address.split('.', 1)[-1],
+            'type': type,
+            'family': family
+            })
+
+        # Get device properties not given
+        if type is None or family is None:
+            self.type, self.family = self.readMany(['type', 'family'])
+
+    @property
+    def path(self):
+        return self._prefix + '/' + self.address
+
+    def useCache(self, useCache):
+        '''
+        Enable/disable owServer cache for reads.
+        '''
+        self.__dict__['_prefix'] = '' if useCache else '/uncached'
+
+    def read(self, attribute):
+        '''
+        Read device attribute.
+        '''
+        return self._client.read(self.path + '/' + attribute).strip()
+
+    def readMany(self, attributes):
+        '''
+        Read device attributes in one (pipelined) request.
+        '''
+        values = self._client.readMany([self.path + '/' + attribute for attribute in attributes])
+        for value in values:
+            if isinstance(value, owNetError):
+                raise value
+        return [value.strip() for value in values]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.read(name)
+        except owNetError as e:
+            if e.errno is None:
+                raise
+            raise AttributeError(name + " - " + str(e))
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            self._client.write(self.path + '/' + name, value)
+
+    def __repr__(self):
+        return 'owNetSensor(' + self.address + ')'
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+owsim - Simulated 1-Wire installation for benchmarking the Greger Client
+Module (GCM).
+
+Serves DS18B20 and DS2438 devices with realistic signals, read dropouts and
+hot-plugging through the fake owServer (owfake), and measures cycle time,
+memory and upload size of owDevices for installations of any size.
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import sys, time
+import math
+import json
+import random
+import logging
+import argparse
+import resource
+import ConfigParser
+
+# Local Modules
+from owfake import owFakeBus
+from owfake import owFakeServer
+from gdb import GregerDatabase as greger
+from owd import owDevices
+
+# Settings used by the simulation, unless given
+_defaultSettings = {
+    'owdEnableTimeseries': True,
+    'owdSensorResolution': 1,
+    'owdEnableStrftime': False,
+    'owdTimeseriesBucketType': 's',
+    'owdTimeseriesBucketSize': 10
+}
+
+class simulatedSignal(object):
+    '''
+    Sensor signal: daily cycle, slow random walk and measurement noise,
+    quantized to the sensor resolution.
+    '''
+
+    def __init__(self, base, amplitude=2.0, walk=0.01, noise=0.05, resolution=0.0625):
+        '''
+        Initialize class. Walk is the random walk (per square root second).
+        '''
+        self.base = base
+        self.amplitude = amplitude
+        self.walk = walk
+        self.noise = noise
+        self.resolution = resolution
+        self.offset = 0.0
+        self.phase = random.uniform(0, 2 * math.pi)
+        self._lastTime = time.time()
+
+    def __call__(self):
+        t = time.time()
+        self.offset += random.gauss(0, self.walk * math.sqrt(max(t - self._lastTime, 0)))
+        self._lastTime = t
+
+        value = (self.base + self.offset + random.gauss(0, self.noise) +
+            self.amplitude * math.sin(2 * math.pi * (t % 86400) / 86400 + self.phase))
+        if self.resolution:
+            value = round(value / self.resolution) * self.resolution
+        return value
+
+class simulatedBus(owFakeBus):
+    '''
+    Virtual 1-Wire bus of DS18B20 and DS2438 devices, where reads fail with
+    probability dropout and a random device is unplugged (and the last one
+    re-plugged) every hotplugInterval seconds.
+    '''
+
+    def __init__(self, ds18b20=10, ds2438=0, dropout=0, hotplugInterval=0):
+        '''
+        Initialize class
+        '''
+        owFakeBus.__init__(self)
+        self.dropout = dropout
+        self.hotplugInterval = hotplugInterval
+        self.dropouts = 0
+        self.hotplugs = 0
+        self._unplugged = {}
+        self._hotplugTime = time.time()
+
+        for i in range(ds18b20):
+            temperature = simulatedSignal(random.uniform(15, 25))
+            self.addDevice('28.%012X' % (i + 1), 'DS18B20',
+                temperature=temperature, latesttemp=temperature,
+                temphigh='75', templow='10')
+        # Serials follow the DS18B20 ones - device ids leave out the family code
+        for i in range(ds2438):
+            temperature = simulatedSignal(random.uniform(15, 25), resolution=0.03125)
+            humidity = simulatedSignal(random.uniform(40, 60), amplitude=5, walk=0.05,
+                noise=0.5, resolution=0.1)
+            self.addDevice('26.%012X' % (ds18b20 + i + 1), 'DS2438',
+                temperature=temperature, humidity=humidity)
+
+    @property
+    def sensors(self):
+        '''
+        Number of sensor values on bus (plugged devices).
+        '''
+        with self.lock:
+            return sum(2 if device['type'] == 'DS2438' else 1
+                for device in self.devices.values())
+
+    def _hotplug(self):
+        '''
+        Re-plug unplugged devices and unplug a random device, if due.
+        '''
+        if time.time() - self._hotplugTime < self.hotplugInterval:
+            return
+        self._hotplugTime = time.time()
+
+        with self.lock:
+            self.devices.update(self._unplugged)
+            self._unplugged = {}
+            if self.devices:
+                id = random.choice(self.devices.keys())
+                self._unplugged[id] = self.devices.pop(id)
+                self.hotplugs += 1
+
+    def dir(self, path):
+        if self.hotplugInterval and not self._split(path):
+            self._hotplug()
+        return owFakeBus.dir(self, path)
+
+    def read(self, path):
+        if self.dropout and random.random() < self.dropout:
+            self.dropouts += 1
+            return None
+        return owFakeBus.read(self, path)
+
+def benchmark(ds18b20=10, ds2438=0, cycles=5, latency=0, dropout=0,
+        hotplugInterval=0, settings=None):
+    '''
+    Read simulated bus with owDevices for a number of cycles.
+
+    Returns dict of cycle time (s), memory and upload size (bytes) of the
+    readings, timeseries and metrics published each cycle.
+    '''
+    bus = simulatedBus(ds18b20, ds2438, dropout, hotplugInterval)
+    server = owFakeServer(bus, latency=latency)
+    server.start()
+
+    # Local configuration and settings
+    config = ConfigParser.RawConfigParser()
+    config.add_section('owserver')
+    config.set('owserver', 'server', server.address)
+    config.set('owserver', 'backend', 'ownet')
+
+    simSettings = dict(_defaultSettings)
+    simSettings.update(settings or {})
+    greger.settings = dict((name, {'name': name, 'moduleID': 'owsim', 'value': value})
+        for name, value in simSettings.items())
+    greger.options.refresh(greger.settings)
+
+    devices = owDevices(config)
+    cycleTimes = []
+    uploadBytes = 0
+    try:
+        for cycle in range(cycles):
+            startTime = time.time()
+            reading = devices.readAll()
+            cycleTimes.append(time.time() - startTime)
+
+            uploadBytes += (len(json.dumps(reading)) +
+                len(json.dumps(devices.timeseries)) +
+                len(json.dumps(devices.rollups)) +
+                len(json.dumps(devices.metrics)))
+    finally:
+        devices.close()
+        server.stop()
+
+    return {
+        'devices': ds18b20 + ds2438,
+        'sensors': ds18b20 + 2 * ds2438,
+        'cycleTimeMean': sum(cycleTimes) / len(cycleTimes),
+        'cycleTimeMax': max(cycleTimes),
+        'uploadBytes': uploadBytes / cycles,
+        'timeseriesBytes': devices.metrics['timeseriesBytes'],
+        'maxRSS': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'dropouts': bus.dropouts,
+        'hotplugs': bus.hotplugs
+        }
+
+def _settingValue(value):
+    '''
+    Parse setting value given on command line (JSON, else string).
+    '''
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark owDevices on a simulated 1-Wire bus.')
+    parser.add_argument('--sizes', default='10,100,5000', help='Comma separated numbers of devices (default 10,100,5000).')
+    parser.add_argument('--ds2438-share', type=float, default=0.1, help='Share of DS2438 devices (default 0.1).')
+    parser.add_argument('--cycles', type=int, default=5, help='Read cycles per size (default 5).')
+    parser.add_argument('--latency', type=float, default=0, help='Delay per owServer request (s).')
+    parser.add_argument('--dropout', type=float, default=0, help='Probability of a failed read.')
+    parser.add_argument('--hotplug', type=float, default=0, help='Interval (s) between hot-plugs, 0 = none.')
+    parser.add_argument('--setting', action='append', default=[], help='GDB setting <name>=<value>, e.g. owdReadThreads=4.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    settings = {}
+    for setting in args.setting:
+        name, sep, value = setting.partition('=')
+        settings[name.strip()] = _settingValue(value.strip())
+
+    print "%8s %8s %12s %12s %12s %14s %10s" % ('devices', 'sensors', 'cycle (s)',
+        'max (s)', 'upload (kB)', 'timeseries (kB)', 'RSS (MB)')
+    for size in args.sizes.split(','):
+        ds2438 = int(round(int(size) * args.ds2438_share))
+        result = benchmark(int(size) - ds2438, ds2438, args.cycles, args.latency,
+            args.dropout, args.hotplug, settings)
+        print "%8d %8d %12.3f %12.3f %12.1f %14.1f %10.1f" % (result['devices'], result['sensors'],
+            result['cycleTimeMean'], result['cycleTimeMax'], result['uploadBytes'] / 1024.0,
+            result['timeseriesBytes'] / 1024.0, result['maxRSS'] / 1048576.0)
+        sys.stdout.flush()
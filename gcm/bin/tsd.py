@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+tsd - Library for timeseries data.
+
+Compact timeseries containers adapted for the Greger Client Module (GCM).
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+# Modules goes here
+import sys, time
+import math
+import json
+from collections import deque
+
+class bucketStats(object):
+    '''
+    Running statistics of one (device, sensor) series within a time bucket.
+
+    Min, max, count, mean and variance are updated for each sample (Welford's
+    algorithm), so no raw samples are kept and memory per series is constant.
+    '''
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        '''
+        Add sample value.
+        '''
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        '''
+        Merge statistics of another bucketStats into this one (Chan et al.).
+        '''
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def point(self, ndigits=1):
+        '''
+        Timeseries point of statistics.
+        '''
+        return {
+            'max': self.max,
+            'min' : self.min,
+            'mean' : round(self.mean, ndigits),
+            'stddev' : round(self.stddev, ndigits),
+            'count' : self.count
+            }
+
+    @property
+    def variance(self):
+        '''
+        Population variance of samples.
+        '''
+        if self.count == 0:
+            return 0.0
+        return self.m2 / self.count
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+# Bucket width units (s)
+_bucketUnits = {
+    's' : 1,
+    'm' : 60,
+    'h' : 3600,
+    'd' : 86400
+}
+
+def bucketWidth(bucketType, bucketSize):
+    '''
+    Bucket width in seconds, e.g. ('m', 15) -> 900.
+    '''
+    width = _bucketUnits[str(bucketType).lower()] * int(bucketSize)
+    if width <= 0:
+        raise ValueError("Bucket size must be positive! - " + str(bucketSize))
+    return width
+
+def utcOffset(t):
+    '''
+    Offset (s) of local time from UTC at epoch t.
+    '''
+    if time.localtime(t).tm_isdst > 0:
+        return -time.altzone
+    return -time.timezone
+
+def localToEpoch(local, t):
+    '''
+    Epoch of local wall-clock time (seconds, as epoch + UTC offset), using
+    the UTC offset in effect at that time. t is a nearby epoch, used when the
+    local time does not exist (skipped by DST change).
+    '''
+    guess = local - utcOffset(t)
+    epoch = local - utcOffset(guess)
+    if utcOffset(epoch) == local - epoch:
+        return epoch
+    return guess
+
+class bucketBoundary(object):
+    '''
+    Start and end (epoch) of a time bucket of any width (s), aligned to local
+    wall-clock time, e.g. 15 min buckets start at :00, :15, :30 and :45 and
+    1 day buckets at local midnight.
+
+    Edges are computed once per bucket, so checking if a time is past the
+    bucket is a single comparison: t >= boundary.end
+    '''
+
+    __slots__ = ('width', 'start', 'end')
+
+    def __init__(self, width=1):
+        '''
+        Initialize class
+        '''
+        self.width = width
+        self.start = 0
+        self.end = 0
+
+    def set(self, t):
+        '''
+        Set bucket to the one containing epoch t.
+        '''
+        width = self.width
+        localStart = (t + utcOffset(t)) // width * width
+
+        # Edges in local time, with the UTC offset in effect at each edge
+        # (DST change within bucket)
+        self.start = localToEpoch(localStart, t)
+        end = localToEpoch(localStart + width, t)
+        self.end = end if end > t else self.start + width
+
+class timeseriesRetention(object):
+    '''
+    Retention policy for a timeseries dict {deviceId: {sensor: {epoch: point}}}.
+
+    Keys of each series are kept in insertion (time) order, so the oldest
+    points are evicted in amortized O(1) per point.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        self._keys = {}             # (deviceId, sensor) -> deque of (epoch, key)
+        self._pointBytes = 0        # Estimated size of one point
+        self.points = 0
+        self.evicted = 0
+
+    def add(self, deviceId, sensor, key, point):
+        '''
+        Register point added to timeseries with key (epoch string).
+        '''
+        series = self._keys.get((deviceId, sensor))
+        if series is None:
+            series = self._keys[(deviceId, sensor)] = deque()
+        series.append((int(key), key))
+        self.points += 1
+
+        if not self._pointBytes:
+            self._pointBytes = (sys.getsizeof(key) + sys.getsizeof(point) +
+                sum(sys.getsizeof(value) for value in point.values()))
+
+    def evict(self, timeseries, maxAge=0, maxPoints=0, now=0):
+        '''
+        Remove points older than maxAge seconds (before now), and the oldest
+        points of series longer than maxPoints. 0 = unlimited.
+
+        Returns number of points evicted.
+        '''
+        evicted = 0
+        oldest = now - maxAge
+        for (deviceId, sensor), series in self._keys.items():
+            points = timeseries[deviceId][sensor]
+            while series and (
+                    (maxPoints and len(series) > maxPoints) or
+                    (maxAge and series[0][0] < oldest)):
+                points.pop(series.popleft()[1], None)
+                evicted += 1
+
+        self.points -= evicted
+        self.evicted += evicted
+        return evicted
+
+    def footprint(self, timeseries):
+        '''
+        Estimated memory footprint (bytes) of timeseries.
+        '''
+        footprint = sys.getsizeof(timeseries) + self.points * self._pointBytes
+        for deviceId in timeseries:
+            footprint += sys.getsizeof(timeseries[deviceId])
+            for sensor in timeseries[deviceId]:
+                footprint += sys.getsizeof(timeseries[deviceId][sensor])
+        return footprint
+
+class rollupTier(object):
+    '''
+    Coarser resolution of a timeseries, built incrementally by folding the
+    statistics of finished (finer) buckets into the buckets of this tier.
+    '''
+
+    def __init__(self, name, width, maxPoints=0, maxAge=0):
+        '''
+        Initialize class
+        '''
+        self.name = name
+        self.maxPoints = maxPoints
+        self.maxAge = maxAge
+        self.boundary = bucketBoundary(width)
+        self.retention = timeseriesRetention()
+        self._stats = {}            # deviceId -> sensor -> bucketStats
+
+        # Output variable
+        self.timeseries = {}
+
+    @property
+    def width(self):
+        return self.boundary.width
+
+    def advance(self, t, ndigits=1):
+        '''
+        Move to the tier bucket containing time t (epoch), flushing the
+        current tier bucket to timeseries if t is past its end.
+        '''
+        if t < self.boundary.end:
+            return
+        if self._stats:
+            self._flush(ndigits)
+        self.boundary.set(t)
+
+    def fold(self, deviceId, sensor, stats, t, ndigits=1):
+        '''
+        Fold statistics of a finished bucket starting at time t into tier.
+        '''
+        self.advance(t, ndigits)
+        deviceStats = self._stats.setdefault(deviceId, {})
+        if sensor not in deviceStats:
+            deviceStats[sensor] = bucketStats()
+        deviceStats[sensor].merge(stats)
+
+    def _flush(self, ndigits):
+        '''
+        Add statistics of current tier bucket to timeseries.
+        '''
+        key = str(int(self.boundary.start))
+        for deviceId in self._stats:
+            deviceSeries = self.timeseries.setdefault(deviceId, {})
+            for sensor, stats in self._stats[deviceId].items():
+                series = deviceSeries.setdefault(sensor, {})
+                point = stats.point(ndigits)
+                if key not in series:
+                    self.retention.add(deviceId, sensor, key, point)
+                series[key] = point
+        self._stats = {}
+
+        self.retention.evict(self.timeseries, self.maxAge, self.maxPoints, time.time())
+
+def parseRollupTiers(spec):
+    '''
+    Parse rollup tier specification, a comma separated list of
+    <name>:<width>[:<maxPoints>], e.g. "hour:1h:720,day:1d:365". Width is
+    given in seconds or with a unit suffix (s, m, h or d).
+
+    Returns list of (name, width, maxPoints).
+    '''
+    tiers = []
+    for tierSpec in str(spec or '').split(','):
+        if not tierSpec.strip():
+            continue
+        fields = [field.strip() for field in tierSpec.split(':')]
+        if len(fields) not in (2, 3) or not fields[0]:
+            raise ValueError("Invalid rollup tier! - " + tierSpec)
+
+        width = fields[1]
+        if width[-1:].lower() in _bucketUnits:
+            width = bucketWidth(width[-1], width[:-1])
+        else:
+            width = int(width)
+        maxPoints = int(fields[2]) if len(fields) == 3 else 0
+
+        tiers.append((fields[0], width, maxPoints))
+    return tiers
+
+class seriesCompressor(object):
+    '''
+    Lossy compression of one timeseries, keeping only the points needed to
+    reconstruct the signal (point mean) within tolerance.
+
+    'deadband' keeps a point when it differs more than tolerance from the last
+    kept point. 'swingingdoor' keeps a point when the following points can no
+    longer be linearly interpolated from it within tolerance.
+
+    A point is always kept at most maxHold seconds (0 = no limit) after the
+    last kept point, so a steady signal is not left out of the series.
+    '''
+
+    __slots__ = ('mode', 'tolerance', 'maxHold', '_archived', '_held', '_slopeMax', '_slopeMin')
+
+    def __init__(self, mode='swingingdoor', tolerance=0.1, maxHold=0):
+        '''
+        Initialize class
+        '''
+        self.mode = mode
+        self.tolerance = tolerance
+        self.maxHold = maxHold
+        self._archived = None       # (t, value) of last kept point
+        self._held = None           # (t, value, point) not yet decided
+        self._slopeMax = 0.0
+        self._slopeMin = 0.0
+
+    def offer(self, t, point, key='mean'):
+        '''
+        Offer point at time t (epoch). Returns list of (t, point) to keep.
+        '''
+        value = point[key]
+
+        # First point is always kept
+        if self._archived is None:
+            self._archived = (t, value)
+            return [(t, point)]
+
+        if self.mode == 'deadband':
+            if abs(value - self._archived[1]) > self.tolerance or self._holdExpired(t):
+                self._archived = (t, value)
+                return [(t, point)]
+            return []
+
+        # Swinging door - narrow the doors from the last kept point
+        t0, v0 = self._archived
+        dt = float(t - t0)
+        if dt <= 0:
+            return []
+        slopeMax = (value + self.tolerance - v0) / dt
+        slopeMin = (value - self.tolerance - v0) / dt
+        if self._held is not None:
+            slopeMax = min(slopeMax, self._slopeMax)
+            slopeMin = max(slopeMin, self._slopeMin)
+
+        # Line to point still within tolerance of all held points - hold it
+        if slopeMin <= (value - v0) / dt <= slopeMax:
+            # Held too long - keep point and restart from it
+            if self._holdExpired(t):
+                self._archived = (t, value)
+                self._held = None
+                return [(t, point)]
+            self._slopeMax, self._slopeMin = slopeMax, slopeMin
+            self._held = (t, value, point)
+            return []
+
+        # Doors closed - keep held point and restart from it
+        heldTime, heldValue, heldPoint = self._held
+        self._archived = (heldTime, heldValue)
+        dt = float(t - heldTime)
+        self._slopeMax = (value + self.tolerance - heldValue) / dt
+        self._slopeMin = (value - self.tolerance - heldValue) / dt
+        self._held = (t, value, point)
+        return [(heldTime, heldPoint)]
+
+    def _holdExpired(self, t):
+        '''
+        Check if maxHold has passed at time t since the last kept point.
+        '''
+        return self.maxHold > 0 and t - self._archived[0] >= self.maxHold
+
+    def flush(self):
+        '''
+        Keep held point (if any), e.g. before shutdown. Returns list of
+        (t, point) to keep.
+        '''
+        if self._held is None:
+            return []
+        heldTime, heldValue, heldPoint = self._held
+        self._archived = (heldTime, heldValue)
+        self._held = None
+        return [(heldTime, heldPoint)]
+
+class timeseriesCompressor(object):
+    '''
+    Lossy compression of all series of a timeseries, see seriesCompressor.
+
+    Counts points and (JSON) bytes offered and kept since local midnight, for
+    the compression ratio and the bytes and writes saved per day.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+        self.mode = ''
+        self.tolerance = 0.0
+        self.maxHold = 0
+        self._series = {}           # (deviceId, sensor) -> seriesCompressor
+        self._day = bucketBoundary(86400)
+        self.pointsIn = 0
+        self.pointsOut = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+
+    def configure(self, mode, tolerance, maxHold=0):
+        '''
+        Set mode ('', 'deadband' or 'swingingdoor'), tolerance and maximum
+        hold time (s). Changing mode or tolerance restarts compression of all
+        series. Returns list of (deviceId, sensor, t, point) held, to keep.
+        '''
+        mode = str(mode or '').lower()
+        if mode not in ('', 'deadband', 'swingingdoor'):
+            raise ValueError("Invalid compression mode! - " + mode)
+        kept = []
+        if (mode, tolerance) != (self.mode, self.tolerance):
+            kept = self.flush()
+            self.mode = mode
+            self.tolerance = tolerance
+            self._series = {}
+        self.maxHold = maxHold
+        for series in self._series.values():
+            series.maxHold = maxHold
+        return kept
+
+    @property
+    def ratio(self):
+        '''
+        Compression ratio (bytes offered / bytes kept) since local midnight.
+        '''
+        if not self.bytesOut:
+            return 1.0
+        return float(self.bytesIn) / self.bytesOut
+
+    def offer(self, deviceId, sensor, t, point):
+        '''
+        Offer point of series at time t (epoch). Returns list of (t, point)
+        to keep.
+        '''
+        # New day - restart counters
+        if t >= self._day.end:
+            self._day.set(t)
+            self.pointsIn = self.pointsOut = self.bytesIn = self.bytesOut = 0
+
+        if not self.mode:
+            kept = [(t, point)]
+        else:
+            series = self._series.get((deviceId, sensor))
+            if series is None:
+                series = self._series[(deviceId, sensor)] = seriesCompressor(self.mode,
+                    self.tolerance, self.maxHold)
+            kept = series.offer(t, point)
+
+        self.pointsIn += 1
+        self.bytesIn += len(json.dumps(point))
+        for keptTime, keptPoint in kept:
+            self.pointsOut += 1
+            self.bytesOut += len(json.dumps(keptPoint))
+        return kept
+
+    def flush(self):
+        '''
+        Keep held points of all series. Returns list of
+        (deviceId, sensor, t, point) to keep.
+        '''
+        kept = []
+        for (deviceId, sensor), series in self._series.items():
+            for keptTime, keptPoint in series.flush():
+                self.pointsOut += 1
+                self.bytesOut += len(json.dumps(keptPoint))
+                kept.append((deviceId, sensor, keptTime, keptPoint))
+        return kept
+
+# Version marker of columnar timeseries documents
+columnarEncoding = 'columnar1'
+
+def encodeColumnar(points):
+    '''
+    Encode points, list of (epoch, point) in time order, as a columnar
+    document: first epoch, deltas to following epochs and one array of
+    values per statistic, e.g.
+        {'enc': 'columnar1', 't0': 1500000000, 'dt': [60, 60],
+         'min': [1.0, 1.1, 1.2], 'mean': [...], 'max': [...], ...}
+    '''
+    epochs = [int(t) for t, point in points]
+    document = {
+        'enc': columnarEncoding,
+        't0': epochs[0],
+        'dt': [t - prev for prev, t in zip(epochs, epochs[1:])]
+        }
+    for statistic in points[0][1]:
+        document[statistic] = [point.get(statistic) for t, point in points]
+    return document
+
+def _array(value):
+    '''
+    List of array value, as stored (Firebase stores arrays as objects with
+    index keys, and leaves out empty arrays).
+    '''
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return [value[key] for key in sorted(value, key=int)]
+    return list(value)
+
+def decodeColumnar(document):
+    '''
+    Decode columnar document to list of (epoch, point).
+    '''
+    if document.get('enc') != columnarEncoding:
+        raise ValueError("Unknown timeseries encoding! - " + str(document.get('enc')))
+
+    epochs = [int(document['t0'])]
+    for delta in _array(document.get('dt')):
+        epochs.append(epochs[-1] + int(delta))
+    statistics = dict((key, _array(value)) for key, value in document.items()
+        if key not in ('enc', 't0', 'dt'))
+    return [(t, dict((statistic, values[i]) for statistic, values in statistics.items()
+        if i < len(values))) for i, t in enumerate(epochs)]
+
+def decodeTimeseries(series):
+    '''
+    Decode series, dict of points and/or columnar documents by epoch key, to
+    dict of points by epoch key.
+    '''
+    points = {}
+    for key, value in series.items():
+        if isinstance(value, dict) and 'enc' in value:
+            for t, point in decodeColumnar(value):
+                points[str(t)] = point
+        else:
+            points[key] = value
+    return points
+
+def columnarChunks(points, chunkSize, maxAge, t):
+    '''
+    Split points, list of (epoch, point) in time order, in columnar chunks
+    of chunkSize points. The last, partial, chunk is only included if its
+    first point is older than maxAge at time t (epoch).
+
+    Returns list of (last epoch, document).
+    '''
+    chunks = []
+    chunkSize = max(int(chunkSize), 1)
+    for i in range(0, len(points), chunkSize):
+        chunk = points[i:i + chunkSize]
+        if len(chunk) < chunkSize and t - int(chunk[0][0]) < maxAge:
+            break
+        chunks.append((int(chunk[-1][0]), encodeColumnar(chunk)))
+    return chunks
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of Greger Database (GDB) settings streaming, against a local stand-in
+for the Firebase Realtime Database streaming (SSE) REST API.
+
+Run with:
+    python -m unittest discover -s gcm/test
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+import os, sys, time
+import logging
+import json
+import socket
+import shutil
+import tempfile
+import unittest
+import threading
+import ConfigParser
+import BaseHTTPServer
+import SocketServer
+import urllib2
+import httplib
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+
+import gdb
+from gdb import GregerDatabase
+from gsb import storageBackend
+from gsb import storageEvent
+from gsb import storageListener
+
+logging.getLogger('root').addHandler(logging.NullHandler())
+
+def _keys(path):
+    return [key for key in path.split('/') if key]
+
+def _setNode(tree, keys, value):
+    '''
+    Set value at path keys of tree (server side), None deletes.
+    '''
+    node = tree
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    if value is None:
+        node.pop(keys[-1], None)
+    else:
+        node[keys[-1]] = value
+
+def _getNode(tree, keys):
+    node = tree
+    for key in keys:
+        if not isinstance(node, dict) or key not in node:
+            return None
+        node = node[key]
+    return node
+
+def _setting(name, value):
+    return {'name': name, 'moduleID': 'test', 'value': value}
+
+class sseHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    GET <path>.json returns the value at path, or streams changes at and
+    below path (Accept: text/event-stream), as the Firebase REST API.
+    '''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        keys = _keys(self.path.split('?')[0][:-len('.json')])
+        if self.headers.get('Accept') != 'text/event-stream':
+            with self.server.lock:
+                body = json.dumps(_getNode(self.server.tree, keys))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        stream = {'keys': keys, 'handler': self, 'closed': threading.Event()}
+        with self.server.lock:
+            self.server.streams.append(stream)
+            self.send('put', '/', _getNode(self.server.tree, keys))
+        stream['closed'].wait()
+
+    def send(self, eventType, path, data):
+        self.wfile.write("event: " + eventType + "\ndata: " +
+            json.dumps({'path': path, 'data': data}) + "\n\n")
+        self.wfile.flush()
+
+class sseServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Stand-in database server, holding a tree and streaming its changes.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, tree):
+        BaseHTTPServer.HTTPServer.__init__(self, ('localhost', 0), sseHandler)
+        self.tree = tree
+        self.streams = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://localhost:' + str(self.server_address[1])
+
+    def put(self, path, data):
+        '''
+        Replace value at path, and stream 'put' event.
+        '''
+        keys = _keys(path)
+        with self.lock:
+            _setNode(self.tree, keys, data)
+            self._broadcast('put', keys, data)
+
+    def patch(self, path, data):
+        '''
+        Multi-location update of children (relative paths) at path, and
+        stream 'patch' event.
+        '''
+        keys = _keys(path)
+        with self.lock:
+            for child, value in data.items():
+                _setNode(self.tree, keys + _keys(child), value)
+            self._broadcast('patch', keys, data)
+
+    def _broadcast(self, eventType, keys, data):
+        for stream in self.streams:
+            streamKeys = stream['keys']
+            if keys[:len(streamKeys)] == streamKeys:
+                stream['handler'].send(eventType, '/' + '/'.join(keys[len(streamKeys):]), data)
+
+    def dropStreams(self):
+        '''
+        Close all open streams (e.g. server restart).
+        '''
+        with self.lock:
+            streams, self.streams = self.streams, []
+        for stream in streams:
+            try:
+                stream['handler'].connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            stream['closed'].set()
+
+    def stop(self):
+        self.dropStreams()
+        self.shutdown()
+        self.server_close()
+
+class sseBackend(storageBackend):
+    '''
+    Storage backend reading the stand-in server over its REST API.
+    '''
+
+    name = 'sse'
+
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, path, start=None, end=None):
+        value = json.load(urllib2.urlopen(self.url + '/' + path + '.json'))
+        if isinstance(value, dict) and (start is not None or end is not None):
+            value = dict((key, child) for key, child in value.items()
+                if (start is None or key >= start) and (end is None or key <= end))
+        return value
+
+    def updateMany(self, path, updates):
+        pass
+
+    def listen(self, path, callback):
+        connection = httplib.HTTPConnection(urlparse.urlparse(self.url).netloc)
+        connection.request('GET', '/' + path + '.json', headers={'Accept': 'text/event-stream'})
+        sock = connection.sock
+        response = connection.getresponse().fp     # Unbuffered, line by line
+
+        def read():
+            eventType = None
+            while True:
+                try:
+                    line = response.readline()
+                except (socket.error, ValueError):
+                    return
+                if not line:
+                    return
+                line = line.rstrip('\n')
+                if line.startswith('event: '):
+                    eventType = line[len('event: '):]
+                elif line.startswith('data: ') and eventType in ('put', 'patch'):
+                    message = json.loads(line[len('data: '):])
+                    callback(storageEvent(eventType, message['path'], message['data']))
+
+        thread = threading.Thread(target=read)
+        thread.daemon = True
+        thread.start()
+
+        def close():
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+
+        return storageListener(close, thread.is_alive)
+
+class settingsStreamTest(unittest.TestCase):
+    '''
+    Settings streamed from the stand-in server to GregerDatabase.
+    '''
+
+    settingsPath = 'clients/gcm/settings'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = sseServer({'clients': {
+            'default': {'settings': {}},
+            'gcm': {
+                'about': {'name': 'gcm'},
+                'settings': {
+                    'gdbStreamSettings': _setting('gdbStreamSettings', True),
+                    'gdbCheckUpdateDelay': _setting('gdbCheckUpdateDelay', 0.1),
+                    'owdDeadband': _setting('owdDeadband', 0.5),
+                    'owdReadThreads': _setting('owdReadThreads', 2)
+                    }
+                }
+            }})
+
+        # Local configuration and backend of stand-in server
+        config = ConfigParser.RawConfigParser()
+        config.add_section('greger_client_module')
+        config.set('greger_client_module', 'name', 'gcm')
+        config.add_section('greger_database')
+        config.set('greger_database', 'root', 'clients')
+        config.set('greger_database', 'settingscache', os.path.join(self.directory, 'settings.json'))
+        self._getLocalConfig, self._createBackend = gdb.getLocalConfig, gdb.createBackend
+        gdb.getLocalConfig = lambda: config
+        gdb.createBackend = lambda config: sseBackend(self.server.url)
+
+        GregerDatabase.settings = {}
+        GregerDatabase.options.refresh({})
+        self.database = GregerDatabase()
+        self.database.start()
+        self.waitFor(lambda: self.database._settingsStreamAlive())
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.5)
+
+    def tearDown(self):
+        self.database.stopExecution.set()
+        self.database.join()
+        self.server.stop()
+        gdb.getLocalConfig, gdb.createBackend = self._getLocalConfig, self._createBackend
+        GregerDatabase.settings = {}
+        GregerDatabase.options.refresh({})
+        shutil.rmtree(self.directory)
+
+    def waitFor(self, condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.fail("Condition not met within " + str(timeout) + "s")
+            time.sleep(0.01)
+
+    def test_putRoot(self):
+        settings = dict(self.server.tree['clients']['gcm']['settings'])
+        settings['owdDeadband'] = _setting('owdDeadband', 0.7)
+        del settings['owdReadThreads']
+        self.server.put(self.settingsPath, settings)
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+        self.assertEqual(GregerDatabase.options.owdReadThreads, 1)
+        self.assertNotIn('owdReadThreads', GregerDatabase.settings)
+
+    def test_putNested(self):
+        self.server.put(self.settingsPath + '/owdDeadband/value', 0.7)
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+        self.assertEqual(GregerDatabase.settings['owdDeadband']['name'], 'owdDeadband')
+
+        self.server.put(self.settingsPath + '/owdReadThreads', None)
+        self.waitFor(lambda: 'owdReadThreads' not in GregerDatabase.settings)
+        self.assertEqual(GregerDatabase.options.owdReadThreads, 1)
+
+    def test_patchRoot(self):
+        self.server.patch(self.settingsPath, {
+            'owdDeadband': _setting('owdDeadband', 0.7),
+            'owdReadThreads': None})
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+        self.assertNotIn('owdReadThreads', GregerDatabase.settings)
+
+    def test_patchNested(self):
+        self.server.patch(self.settingsPath + '/owdDeadband', {'value': 0.7})
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+        self.assertEqual(GregerDatabase.settings['owdDeadband']['moduleID'], 'test')
+
+    def test_patchMultiPath(self):
+        self.server.patch(self.settingsPath, {
+            'owdDeadband/value': 0.7,
+            'owdReadThreads/value': 4,
+            'owdAlarmBand': _setting('owdAlarmBand', 2.0)})
+        self.waitFor(lambda: GregerDatabase.options.owdAlarmBand == 2.0)
+        self.assertEqual(GregerDatabase.options.owdDeadband, 0.7)
+        self.assertEqual(GregerDatabase.options.owdReadThreads, 4)
+        self.assertEqual(GregerDatabase.settings['owdDeadband'], _setting('owdDeadband', 0.7))
+        self.assertNotIn('owdDeadband/value', GregerDatabase.settings)
+
+        # Saved settings match
+        with open(self.database._settingsCachePath) as f:
+            self.assertEqual(json.load(f), GregerDatabase.settings)
+
+    def test_malformedSettingIgnored(self):
+        self.server.patch(self.settingsPath, {'owdReadThreads': 3, 'owdDeadband/value': 0.7})
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+        self.assertNotIn('owdReadThreads', GregerDatabase.settings)
+
+    def test_reconnect(self):
+        stream = self.database._settingsStream
+        self.server.dropStreams()
+
+        # Changed while disconnected - fetched on reconnect
+        with self.server.lock:
+            self.server.tree['clients']['gcm']['settings']['owdDeadband']['value'] = 0.7
+        self.waitFor(lambda: self.database._settingsStream is not stream and
+            self.database._settingsStreamAlive())
+        self.waitFor(lambda: GregerDatabase.options.owdDeadband == 0.7)
+
+        # Streamed on new connection
+        self.server.patch(self.settingsPath, {'owdReadThreads/value': 4})
+        self.waitFor(lambda: GregerDatabase.options.owdReadThreads == 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the Greger Database Queue (GDQ).
+
+Run with:
+    python -m unittest discover -s gcm/test
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+import os, sys, time
+import shutil
+import logging
+import tempfile
+import unittest
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+
+from gdq import GregerDatabaseQueue
+
+logging.getLogger('root').addHandler(logging.NullHandler())
+
+class replayTest(unittest.TestCase):
+    '''
+    Replay of queued updates.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = GregerDatabaseQueue(os.path.join(self.directory, 'queue.db'), commitInterval=0.1)
+        self.sent = []
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def send(self, chunk):
+        time.sleep(0.01)
+        self.sent.extend(path for path, value in chunk)
+        return set(path for path, value in chunk)
+
+    def test_replayConcurrent(self):
+        paths = ['device/%03d' % i for i in range(100)]
+        self.queue.put([(path, i) for i, path in enumerate(paths)])
+
+        # Each update sent once, in order
+        threads = [threading.Thread(target=self.queue.replay, args=(self.send, 10))
+            for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.sent, paths)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_replayStopsAtUnconfirmed(self):
+        self.queue.put([('a', 1), ('b', 2), ('c', 3)])
+        self.assertEqual(self.queue.replay(lambda chunk: set(['a', 'c'])), 1)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.replay(self.send), 2)
+        self.assertEqual(self.sent, ['b', 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
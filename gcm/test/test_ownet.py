@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the owServer network protocol client (ownet), against the local
+fake owServer (owfake).
+
+Run with:
+    python -m unittest discover -s gcm/test
+"""
+
+__author__ = "Eric Sandbling"
+__status__ = 'Development'
+
+import os, sys
+import socket
+import logging
+import unittest
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin'))
+
+import ownet
+from ownet import _header
+from ownet import owNetClient
+from ownet import owNetSensor
+from ownet import owNetError
+from ownet import MSG_READ, MSG_WRITE, FLG_OWNET, FLG_PERSISTENCE
+from owfake import owFakeBus
+from owfake import owFakeServer
+
+logging.getLogger('root').addHandler(logging.NullHandler())
+
+class droppingServer(owFakeServer):
+    '''
+    Fake owServer able to drop all client connections (e.g. restart).
+    '''
+
+    def __init__(self, bus):
+        owFakeServer.__init__(self, bus)
+        self.connections = []
+
+    def finish_request(self, request, client_address):
+        self.connections.append(request)
+        owFakeServer.finish_request(self, request, client_address)
+
+    def dropConnections(self):
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+class owNetTest(unittest.TestCase):
+    '''
+    owNetClient and owNetSensor against a fake owServer.
+    '''
+
+    def setUp(self):
+        self.bus = owFakeBus()
+        for i in range(100):
+            self.bus.addDevice('28.%012X' % (i + 1), 'DS18B20',
+                temperature=20.0 + i, temphigh='150', templow='10')
+        self.bus.addDevice('26.%012X' % 101, 'DS2438', temperature=21.5, humidity=45.0)
+
+        self.server = droppingServer(self.bus)
+        self.server.start()
+        self.client = owNetClient('localhost', self.server.port, timeout=2.0)
+
+    def tearDown(self):
+        self.client.closeAll()
+        self.server.stop()
+
+    def test_requestHeader(self):
+        request = self.client._request(MSG_READ, '/28.000000000001/temperature')
+        version, payload, msgType, flags, size, offset = _header.unpack(request[:_header.size])
+        self.assertEqual((version, msgType, size, offset), (0, MSG_READ, ownet._maxReadSize, 0))
+        self.assertEqual(flags, FLG_OWNET | FLG_PERSISTENCE)
+        self.assertEqual(payload, len(request) - _header.size)
+        self.assertEqual(request[_header.size:], '/28.000000000001/temperature\0')
+
+        request = self.client._request(MSG_WRITE, '/28.000000000001/temphigh', '30')
+        version, payload, msgType, flags, size, offset = _header.unpack(request[:_header.size])
+        self.assertEqual((msgType, size), (MSG_WRITE, 2))
+        self.assertEqual(request[_header.size:], '/28.000000000001/temphigh\0' + '30')
+
+    def test_dir(self):
+        entries = self.client.dir('/')
+        self.assertEqual(len(entries), 101)
+        self.assertEqual(entries[0], '/26.000000000065')
+        self.assertIn('/28.000000000001', entries)
+
+        self.assertEqual(self.client.dir('/28.000000000001'), [
+            '/28.000000000001/family', '/28.000000000001/id',
+            '/28.000000000001/temperature', '/28.000000000001/temphigh',
+            '/28.000000000001/templow', '/28.000000000001/type'])
+
+        with self.assertRaises(owNetError) as error:
+            self.client.dir('/28.0000000000FF')
+        self.assertEqual(error.exception.errno, 2)
+
+    def test_devices(self):
+        devices = self.client.devices('/')
+        self.assertEqual(len(devices), 101)
+        self.assertIn('28.000000000001', devices)
+        self.assertIn('26.000000000065', devices)
+
+        # Attributes are not devices
+        self.assertEqual(self.client.devices('/28.000000000001'), [])
+
+    def test_read(self):
+        self.assertEqual(float(self.client.read('/28.000000000001/temperature')), 20.0)
+        self.assertEqual(float(self.client.read('/uncached/26.000000000065/humidity')), 45.0)
+
+        with self.assertRaises(owNetError) as error:
+            self.client.read('/28.000000000001/humidity')
+        self.assertEqual(error.exception.errno, 2)
+
+    def test_readManyPipelined(self):
+        paths = ['/28.%012X/temperature' % (i + 1) for i in range(100)]
+
+        # Requests in flight bounded by pipeline depth
+        transacts = []
+        transact = self.client._transact
+        def record(requests):
+            transacts.append(len(requests))
+            return transact(requests)
+        self.client._transact = record
+
+        values = self.client.readMany(paths)
+        self.assertEqual([float(value) for value in values], [20.0 + i for i in range(100)])
+        self.assertEqual(transacts, [ownet._pipelineDepth, 100 - ownet._pipelineDepth])
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_readManyErrors(self):
+        values = self.client.readMany([
+            '/28.000000000001/temperature',
+            '/28.000000000001/humidity',
+            '/28.0000000000FF/temperature',
+            '/28.000000000002/temperature'])
+        self.assertEqual(float(values[0]), 20.0)
+        self.assertIsInstance(values[1], owNetError)
+        self.assertEqual(values[1].errno, 2)
+        self.assertIsInstance(values[2], owNetError)
+        self.assertEqual(float(values[3]), 21.0)
+        self.assertEqual(self.client.readMany([]), [])
+
+    def test_write(self):
+        self.client.write('/28.000000000001/temphigh', 30)
+        self.assertEqual(self.bus.devices['28.000000000001']['temphigh'], '30')
+
+        with self.assertRaises(owNetError):
+            self.client.write('/28.0000000000FF/temphigh', 30)
+
+    def test_present(self):
+        self.assertTrue(self.client.present('/28.000000000001'))
+        self.assertFalse(self.client.present('/28.0000000000FF'))
+
+    def test_reconnect(self):
+        self.assertEqual(float(self.client.read('/28.000000000001/temperature')), 20.0)
+        self.server.dropConnections()
+
+        # Lost connection - reconnected and retried
+        values = self.client.readMany(['/28.000000000002/temperature', '/28.000000000003/temperature'])
+        self.assertEqual([float(value) for value in values], [21.0, 22.0])
+        self.assertEqual(len(self.server.connections), 2)
+
+    def test_serverDown(self):
+        self.client.read('/28.000000000001/temperature')
+        self.server.stop()
+        self.server.dropConnections()
+        with self.assertRaises(owNetError) as error:
+            self.client.read('/28.000000000001/temperature')
+        self.assertIsNone(error.exception.errno)
+
+        # Server for tearDown
+        self.server = droppingServer(self.bus)
+        self.server.start()
+
+    def test_persistenceNotGranted(self):
+        # Server closes connection after each response
+        self.client.flags = FLG_OWNET
+        values = self.client.readMany(['/28.%012X/temperature' % (i + 1) for i in range(5)])
+        self.assertEqual([float(value) for value in values], [20.0, 21.0, 22.0, 23.0, 24.0])
+        self.assertEqual(len(self.server.connections), 5)
+
+    def test_connectionPerThread(self):
+        self.client.read('/28.000000000001/temperature')
+        thread = threading.Thread(target=self.client.read, args=('/28.000000000002/temperature',))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(self.client._sockets), 2)
+
+        self.client.closeAll()
+        self.assertEqual(len(self.client._sockets), 0)
+        self.assertIsNone(self.client._socket)
+
+    def test_alarm(self):
+        self.assertEqual(self.client.devices('/alarm'), [])
+
+        # Thresholds around reading, out of range
+        self.client.write('/28.000000000003/temphigh', 21)
+        self.client.write('/28.000000000005/templow', 25)
+        self.assertEqual(self.client.devices('/alarm'), ['28.000000000003', '28.000000000005'])
+
+    def test_sensor(self):
+        sensor = owNetSensor(self.client, '28.000000000001')
+        self.assertEqual((sensor.type, sensor.family), ('DS18B20', '28'))
+        self.assertEqual((sensor.address, sensor.id), ('28.000000000001', '000000000001'))
+        self.assertEqual(sensor.path, '/28.000000000001')
+        self.assertEqual(float(sensor.temperature), 20.0)
+        self.assertEqual(sensor.readMany(['temphigh', 'templow']), ['150', '10'])
+
+        sensor.useCache(False)
+        self.assertEqual(sensor.path, '/uncached/28.000000000001')
+
+        # Attributes not set on sensor are written to device
+        sensor.temphigh = 30
+        self.assertEqual(self.bus.devices['28.000000000001']['temphigh'], '30')
+
+        with self.assertRaises(AttributeError):
+            sensor.humidity
+        with self.assertRaises(owNetError):
+            sensor.readMany(['temperature', 'humidity'])
+
+if __name__ == '__main__':
+    unittest.main()